@@ -3,13 +3,25 @@ FastAPI Backend for Finance RAG Chatbot
 REST API endpoints for querying SEC filings
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any
+import anyio
+import hashlib
+import json
+import os
+import threading
+import time
 import uvicorn
 
+from config import STATS_CACHE_TTL, PREWARM_ENABLED
+
 from rag_engine import RAGEngine
+from snapshot import bootstrap_from_snapshot
+from ingest_jobs import IngestJobManager
+from prewarm import PrewarmScheduler
 
 app = FastAPI(
     title="Finance RAG API",
@@ -25,14 +37,57 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# New replicas load a prebuilt index instead of re-running the embed pipeline.
+# A snapshot built with a different embedding model stops startup here.
+if os.getenv("INDEX_SNAPSHOT"):
+    bootstrap_from_snapshot(os.getenv("INDEX_SNAPSHOT"))
+
 print("Initializing RAG Engine...")
-rag_engine = RAGEngine()
+# serve.py sets RAG_DEFER_CONNECT so each forked worker connects on its own
+rag_engine = RAGEngine(connect=os.getenv("RAG_DEFER_CONNECT") != "1")
 print("RAG Engine ready!")
 
-class QueryRequest(BaseModel):
+ingest_jobs = IngestJobManager(rag_engine)
+prewarm = PrewarmScheduler(rag_engine)
+
+@app.on_event("startup")
+def limit_request_threads():
+    # Sync endpoints run in anyio's thread pool, sized per worker in production
+    threads = os.getenv("API_THREADS_PER_WORKER")
+    if threads:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = int(threads)
+
+@app.on_event("startup")
+def start_prewarm():
+    # Every worker starts one after connecting; only the one holding the lock runs passes
+    if PREWARM_ENABLED:
+        prewarm.start()
+
+@app.on_event("shutdown")
+def stop_prewarm():
+    prewarm.stop()
+
+class FilterFields(BaseModel):
+    filing_type: Optional[str] = None
+    fiscal_year: Optional[int] = None
+    fiscal_period: Optional[str] = None  # FY, Q1, Q2, Q3
+    section: Optional[str] = None  # item code like "1A" or a title like "Risk Factors"
+    latest: bool = False  # only the most recent matching filing
+    
+    def filters(self) -> Dict:
+        return {
+            'filing_type': self.filing_type,
+            'fiscal_year': self.fiscal_year,
+            'fiscal_period': self.fiscal_period,
+            'section': self.section,
+            'latest': self.latest
+        }
+
+class QueryRequest(FilterFields):
     question: str
     ticker: Optional[str] = None
     n_results: int = 5
+    session_id: Optional[str] = None  # continue a conversation created with POST /sessions
 
 class Source(BaseModel):
     ticker: str
@@ -43,6 +98,96 @@ class QueryResponse(BaseModel):
     question: str
     answer: str
     sources: List[Source]
+    session_id: Optional[str] = None
+
+class SessionResponse(BaseModel):
+    session_id: str
+    turns: int
+    ticker: Optional[str] = None
+    idle_seconds: float
+
+def get_session(session_id: Optional[str]):
+    if not session_id:
+        return None
+    session = rag_engine.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session
+
+class IngestRequest(BaseModel):
+    download: bool = False  # fetch new filings from EDGAR before processing
+    tickers: Optional[List[str]] = None
+    filings_per_type: int = Field(2, ge=1, le=20)
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    done: int
+    total: int
+    target_collection: str
+    created: float
+    finished: Optional[float] = None
+    error: Optional[str] = None
+
+MAX_BATCH_QUERIES = 50
+MAX_SEARCH_OFFSET = 500
+
+class SearchRequest(FilterFields):
+    query: str
+    ticker: Optional[str] = None
+    limit: int = Field(10, ge=1, le=100)
+    offset: int = Field(0, ge=0, le=MAX_SEARCH_OFFSET)
+    include_full_text: bool = False
+    rerank: bool = False  # opt-in, the cross-encoder costs far more than the vector search
+
+class BatchSearchRequest(FilterFields):
+    queries: List[str]
+    ticker: Optional[str] = None
+    limit: int = Field(10, ge=1, le=100)
+    offset: int = Field(0, ge=0, le=MAX_SEARCH_OFFSET)
+    include_full_text: bool = False
+    rerank: bool = False  # opt-in, the cross-encoder costs far more than the vector search
+
+class SearchHit(BaseModel):
+    rank: int
+    distance: float
+    rerank_score: Optional[float] = None
+    ticker: str
+    filing_type: str
+    accession: str
+    metadata: Dict[str, Any]
+    text: str
+
+class SearchResponse(BaseModel):
+    query: str
+    offset: int
+    limit: int
+    results: List[SearchHit]
+
+class BatchSearchResponse(BaseModel):
+    results: List[SearchResponse]
+
+def build_search_response(query: str, chunks: List[Dict], offset: int,
+                          limit: int, include_full_text: bool) -> SearchResponse:
+    return SearchResponse(
+        query=query,
+        offset=offset,
+        limit=limit,
+        results=[
+            SearchHit(
+                rank=offset + i,
+                distance=chunk['distance'],
+                rerank_score=chunk.get('rerank_score'),
+                ticker=chunk['ticker'],
+                filing_type=chunk['filing_type'],
+                accession=chunk['accession'],
+                metadata=chunk['metadata'],
+                text=chunk['text'] if include_full_text else chunk['text'][:500]
+            )
+            for i, chunk in enumerate(chunks, 1)
+        ]
+    )
 
 @app.get("/")
 def read_root():
@@ -54,12 +199,24 @@ def read_root():
 
 @app.post("/query", response_model=QueryResponse)
 def query_filings(request: QueryRequest):
+    session = get_session(request.session_id)
+    
     try:
-        result = rag_engine.query(
-            question=request.question,
-            ticker=request.ticker,
-            n_results=request.n_results
-        )
+        if session:
+            result = rag_engine.query_session(
+                session,
+                question=request.question,
+                ticker=request.ticker,
+                n_results=request.n_results,
+                filters=request.filters()
+            )
+        else:
+            result = rag_engine.query(
+                question=request.question,
+                ticker=request.ticker,
+                n_results=request.n_results,
+                filters=request.filters()
+            )
         
         sources = [
             Source(
@@ -73,12 +230,148 @@ def query_filings(request: QueryRequest):
         return QueryResponse(
             question=result['question'],
             answer=result['answer'],
-            sources=sources
+            sources=sources,
+            session_id=result.get('session_id')
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/stream")
+def query_filings_stream(request: QueryRequest):
+    session = get_session(request.session_id)
+    
+    def events():
+        try:
+            if session:
+                stream = rag_engine.query_session_stream(
+                    session,
+                    question=request.question,
+                    ticker=request.ticker,
+                    n_results=request.n_results,
+                    filters=request.filters()
+                )
+            else:
+                stream = rag_engine.query_stream(
+                    question=request.question,
+                    ticker=request.ticker,
+                    n_results=request.n_results,
+                    filters=request.filters()
+                )
+            
+            for event in stream:
+                if event['type'] == 'result':
+                    event = {
+                        'type': 'result',
+                        'question': event['question'],
+                        'answer': event['answer'],
+                        'session_id': event.get('session_id'),
+                        'sources': [
+                            Source(
+                                ticker=chunk['ticker'],
+                                filing_type=chunk['filing_type'],
+                                text=chunk['text'][:500]
+                            ).dict()
+                            for chunk in event['sources']
+                        ]
+                    }
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'detail': str(e)}) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.post("/sessions", response_model=SessionResponse)
+def create_session():
+    return SessionResponse(**rag_engine.sessions.create().summary())
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+def read_session(session_id: str):
+    return SessionResponse(**get_session(session_id).summary())
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not rag_engine.sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"deleted": session_id}
+
+@app.post("/search", response_model=SearchResponse)
+def search_filings(request: SearchRequest):
+    # Retrieval only, the LLM is never called
+    try:
+        chunks = rag_engine.search(
+            [request.query],
+            n_results=request.limit,
+            ticker=request.ticker,
+            offset=request.offset,
+            rerank=request.rerank,
+            filters=request.filters()
+        )[0]
+        return build_search_response(
+            request.query, chunks, request.offset,
+            request.limit, request.include_full_text
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+def search_filings_batch(request: BatchSearchRequest):
+    if not 1 <= len(request.queries) <= MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"queries must contain between 1 and {MAX_BATCH_QUERIES} items"
+        )
+    
+    try:
+        all_chunks = rag_engine.search(
+            request.queries,
+            n_results=request.limit,
+            ticker=request.ticker,
+            offset=request.offset,
+            rerank=request.rerank,
+            filters=request.filters()
+        )
+        return BatchSearchResponse(results=[
+            build_search_response(
+                query, chunks, request.offset,
+                request.limit, request.include_full_text
+            )
+            for query, chunks in zip(request.queries, all_chunks)
+        ])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/ingest", response_model=IngestJobResponse, status_code=202)
+def start_ingest(request: IngestRequest):
+    # Builds a shadow collection in the background and swaps it in when done
+    try:
+        job = ingest_jobs.start(
+            download=request.download,
+            tickers=request.tickers,
+            filings_per_type=request.filings_per_type
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return IngestJobResponse(**job.summary())
+
+@app.get("/ingest/{job_id}", response_model=IngestJobResponse)
+def read_ingest_job(job_id: str):
+    summary = ingest_jobs.get(job_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return IngestJobResponse(**summary)
+
+@app.post("/ingest/rollback")
+def rollback_ingest():
+    try:
+        return ingest_jobs.rollback()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/prewarm")
+def read_prewarm():
+    return prewarm.summary()
+
 @app.get("/companies")
 def get_companies():
     from config import TECH_COMPANIES
@@ -87,19 +380,51 @@ def get_companies():
         "total": len(TECH_COMPANIES)
     }
 
+stats_cache: Dict[str, Any] = {"body": None, "etag": None, "collection": None, "expires": 0.0}
+stats_lock = threading.Lock()
+
+def compute_stats() -> Dict:
+    count = rag_engine.collection.count()
+    return {
+        "total_chunks": count,
+        "collection": rag_engine.collection_name,
+        "embedding_model": "intfloat/e5-large-v2",
+        "llm_model": "llama3.1:8b",
+        "vector_db": "ChromaDB",
+        # Outstanding request counts are left out, they would change the ETag on every poll
+        "llm_backends": [
+            {"host": backend["host"], "healthy": backend["healthy"]}
+            for backend in rag_engine.llm.status()
+        ]
+    }
+
 @app.get("/stats")
-def get_stats():
+def get_stats(request: Request):
     try:
-        count = rag_engine.collection.count()
-        return {
-            "total_chunks": count,
-            "embedding_model": "intfloat/e5-large-v2",
-            "llm_model": "llama3.1:8b",
-            "vector_db": "ChromaDB"
-        }
+        rag_engine.refresh_collection()
+        with stats_lock:
+            # count() is a full scan on Chroma's side, so keep the result until
+            # the TTL runs out or an ingest/rollback switches the collection
+            if (stats_cache["body"] is None
+                    or time.time() >= stats_cache["expires"]
+                    or stats_cache["collection"] != rag_engine.collection_name):
+                body = compute_stats()
+                digest = hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()
+                stats_cache.update({
+                    "body": body,
+                    "etag": f'"{digest[:16]}"',
+                    "collection": rag_engine.collection_name,
+                    "expires": time.time() + STATS_CACHE_TTL
+                })
+            body, etag = stats_cache["body"], stats_cache["etag"]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    headers = {"ETag": etag, "Cache-Control": f"max-age={STATS_CACHE_TTL}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=body, headers=headers)
+
 if __name__ == "__main__":
     uvicorn.run(
         "api:app",
@@ -1,9 +1,16 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 from typing import List, Dict
+import html
+import os
 import time
 
-API_URL = "http://localhost:8000"
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+COMPANIES_TTL = 600  # seconds
+STATS_TTL = 30  # seconds
+RECENT_SOURCES = 3  # newest answers whose sources are shown without asking
+HISTORY_PAGE = 20  # messages rendered before "Show earlier messages"
 
 st.set_page_config(
     page_title="Finance RAG Chatbot",
@@ -34,16 +41,73 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_http():
+    # One pooled keep-alive session shared by every rerun and browser tab
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    http.mount("http://", adapter)
+    http.mount("https://", adapter)
+    return http
+
+@st.cache_data(ttl=COMPANIES_TTL, show_spinner=False)
+def fetch_companies() -> List[str]:
+    response = get_http().get(f"{API_URL}/companies", timeout=5)
+    response.raise_for_status()
+    return response.json()['companies']
+
+@st.cache_resource
+def get_stats_validator() -> Dict:
+    return {'etag': None, 'stats': None}
+
+@st.cache_data(ttl=STATS_TTL, show_spinner=False)
+def fetch_stats() -> Dict:
+    # Conditional request: the API answers 304 with no body when nothing changed
+    validator = get_stats_validator()
+    headers = {'If-None-Match': validator['etag']} if validator['etag'] else {}
+    response = get_http().get(f"{API_URL}/stats", headers=headers, timeout=5)
+    if response.status_code == 304 and validator['stats'] is not None:
+        return validator['stats']
+    response.raise_for_status()
+    validator['etag'] = response.headers.get('ETag')
+    validator['stats'] = response.json()
+    return validator['stats']
+
+def render_sources_html(sources: List[Dict]) -> str:
+    # Built once per answer and stored, reruns only replay the string
+    return ''.join(
+        f"""
+        <div class="source-box">
+            <strong>Source {i}:</strong> {html.escape(source['ticker'])} - {html.escape(source['filing_type'])}<br>
+            <em>{html.escape(source['text'][:300])}...</em>
+        </div>
+        """
+        for i, source in enumerate(sources, 1)
+    )
+
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 
+if 'history_limit' not in st.session_state:
+    st.session_state.history_limit = HISTORY_PAGE
+
 if 'api_healthy' not in st.session_state:
     try:
-        response = requests.get(f"{API_URL}/")
+        response = get_http().get(f"{API_URL}/", timeout=5)
         st.session_state.api_healthy = response.status_code == 200
     except:
         st.session_state.api_healthy = False
 
+def get_session_id():
+    # One server-side conversation per browser session, so follow-ups keep context
+    if st.session_state.get('session_id') is None:
+        try:
+            response = get_http().post(f"{API_URL}/sessions")
+            st.session_state.session_id = response.json()['session_id']
+        except:
+            st.session_state.session_id = None
+    return st.session_state.session_id
+
 st.markdown('<div class="main-header"> Finance RAG Chatbot</div>', unsafe_allow_html=True)
 st.markdown("---")
 
@@ -58,8 +122,7 @@ with st.sidebar:
     
     if st.session_state.api_healthy:
         try:
-            response = requests.get(f"{API_URL}/companies")
-            companies = response.json()['companies']
+            companies = fetch_companies()
         except:
             companies = []
     else:
@@ -81,8 +144,7 @@ with st.sidebar:
     st.subheader(" Database Stats")
     if st.session_state.api_healthy:
         try:
-            response = requests.get(f"{API_URL}/stats")
-            stats = response.json()
+            stats = fetch_stats()
             st.metric("Total Chunks", stats['total_chunks'])
             st.info(f"**LLM:** {stats['llm_model']}")
             st.info(f"**Embeddings:** {stats['embedding_model']}")
@@ -91,25 +153,39 @@ with st.sidebar:
     
     if st.button(" Clear Chat"):
         st.session_state.chat_history = []
+        if st.session_state.get('session_id'):
+            try:
+                get_http().delete(f"{API_URL}/sessions/{st.session_state.session_id}")
+            except:
+                pass
+        st.session_state.session_id = None
+        st.session_state.history_limit = HISTORY_PAGE
         st.rerun()
 
 st.header(" Chat")
 
-for chat in st.session_state.chat_history:
+history = st.session_state.chat_history
+hidden = max(0, len(history) - st.session_state.history_limit)
+
+if hidden and st.button(f" Show {min(hidden, HISTORY_PAGE)} earlier messages"):
+    st.session_state.history_limit += HISTORY_PAGE
+    st.rerun()
+
+for index in range(hidden, len(history)):
+    chat = history[index]
+    
     with st.chat_message("user"):
         st.write(chat['question'])
     
     with st.chat_message("assistant"):
         st.markdown(f'<div class="answer-box">{chat["answer"]}</div>', unsafe_allow_html=True)
         
-        with st.expander(" View Sources"):
-            for i, source in enumerate(chat['sources'], 1):
-                st.markdown(f"""
-                <div class="source-box">
-                    <strong>Source {i}:</strong> {source['ticker']} - {source['filing_type']}<br>
-                    <em>{source['text'][:300]}...</em>
-                </div>
-                """, unsafe_allow_html=True)
+        # Older answers only render their sources when asked for
+        if index >= len(history) - RECENT_SOURCES:
+            with st.expander(" View Sources"):
+                st.markdown(chat['sources_html'], unsafe_allow_html=True)
+        elif st.checkbox(" View Sources", key=f"sources_{index}"):
+            st.markdown(chat['sources_html'], unsafe_allow_html=True)
 
 user_question = st.chat_input("Ask a question about SEC filings...")
 
@@ -125,33 +201,34 @@ if user_question:
                 try:
                     ticker = None if selected_company == "All Companies" else selected_company
                     
-                    response = requests.post(
-                        f"{API_URL}/query",
-                        json={
-                            "question": user_question,
-                            "ticker": ticker,
-                            "n_results": n_results
-                        }
-                    )
+                    payload = {
+                        "question": user_question,
+                        "ticker": ticker,
+                        "n_results": n_results,
+                        "session_id": get_session_id()
+                    }
+                    response = get_http().post(f"{API_URL}/query", json=payload)
+                    
+                    # Sessions expire when idle; start a fresh one and retry
+                    if response.status_code == 404:
+                        st.warning(" The conversation expired on the server, this question starts a new one")
+                        st.session_state.session_id = None
+                        payload["session_id"] = get_session_id()
+                        response = get_http().post(f"{API_URL}/query", json=payload)
                     
                     if response.status_code == 200:
                         result = response.json()
                         
                         st.markdown(f'<div class="answer-box">{result["answer"]}</div>', unsafe_allow_html=True)
                         
+                        sources_html = render_sources_html(result['sources'])
                         with st.expander(" View Sources"):
-                            for i, source in enumerate(result['sources'], 1):
-                                st.markdown(f"""
-                                <div class="source-box">
-                                    <strong>Source {i}:</strong> {source['ticker']} - {source['filing_type']}<br>
-                                    <em>{source['text'][:300]}...</em>
-                                </div>
-                                """, unsafe_allow_html=True)
+                            st.markdown(sources_html, unsafe_allow_html=True)
                         
                         st.session_state.chat_history.append({
                             'question': user_question,
                             'answer': result['answer'],
-                            'sources': result['sources']
+                            'sources_html': sources_html
                         })
                     else:
                         st.error(f" Error: {response.status_code}")
@@ -2,6 +2,14 @@ from rag_engine import RAGEngine
 from config import TECH_COMPANIES
 import sys
 
+# Inline filters such as "section:1A", "year:2024", "period:Q2", "type:10-Q"
+FILTER_KEYS = {
+    'section': 'section',
+    'year': 'fiscal_year',
+    'period': 'fiscal_period',
+    'type': 'filing_type'
+}
+
 class FinanceChatbot:
     
     def __init__(self):
@@ -13,6 +21,8 @@ class FinanceChatbot:
         print("="*60 + "\n")
         
         self.engine = RAGEngine()
+        # Follow-up questions are answered in the context of earlier turns
+        self.session = self.engine.sessions.create()
         
         print("\n Chatbot ready! Ask me anything about:")
         print("   Company financials (revenue, profits, etc.)")
@@ -36,6 +46,11 @@ class FinanceChatbot:
         print("  - @AAPL What is the iPhone revenue?")
         print("  - @MSFT Tell me about cloud services")
         
+        print("\n FILING FILTERS:")
+        print("  Add section:, year:, period: or type: to narrow the search:")
+        print("  - @AAPL section:risk-factors period:latest What are the main risks?")
+        print("  - @MSFT year:2024 period:Q2 type:10-Q How did cloud revenue do?")
+        
         print("\n COMPARATIVE QUERIES:")
         print("  - Compare revenue between AAPL and MSFT")
         print("  - How do Apple and Microsoft differ?")
@@ -43,6 +58,7 @@ class FinanceChatbot:
         print("\n COMMANDS:")
         print("  - help    : Show this help message")
         print("  - list    : List available companies")
+        print("  - new     : Start a new conversation")
         print("  - clear   : Clear screen")
         print("  - quit    : Exit chatbot")
         print("="*60 + "\n")
@@ -57,7 +73,31 @@ class FinanceChatbot:
         print("\n To add all 35 companies, run the full data download")
         print("="*60 + "\n")
     
+    def parse_filters(self, user_input: str):
+        filters = {}
+        words = []
+        
+        for word in user_input.split():
+            key, _, value = word.partition(':')
+            key = key.lower()
+            if not value or key not in FILTER_KEYS:
+                words.append(word)
+                continue
+            
+            if key == 'period' and value.lower() == 'latest':
+                filters['latest'] = True
+            elif key == 'year' and value.isdigit():
+                filters['fiscal_year'] = int(value)
+            elif key != 'year':
+                filters[FILTER_KEYS[key]] = value
+            else:
+                words.append(word)
+        
+        return ' '.join(words), filters
+    
     def parse_query(self, user_input: str):
+        user_input, filters = self.parse_filters(user_input)
+        
         if '@' in user_input:
             parts = user_input.split('@', 1)
             if len(parts) == 2:
@@ -65,9 +105,9 @@ class FinanceChatbot:
                 if len(ticker_and_question) == 2:
                     ticker = ticker_and_question[0].upper()
                     question = ticker_and_question[1]
-                    return question, ticker
+                    return question, ticker, filters
         
-        return user_input, None
+        return user_input, None, filters
     
     def run(self):
         print(" Type 'help' for commands, 'quit' to exit\n")
@@ -91,13 +131,25 @@ class FinanceChatbot:
                     self.list_companies()
                     continue
                 
+                elif user_input.lower() == 'new':
+                    self.engine.sessions.delete(self.session.session_id)
+                    self.session = self.engine.sessions.create()
+                    print("\n Started a new conversation\n")
+                    continue
+                
                 elif user_input.lower() == 'clear':
                     print("\n" * 50)
                     continue
                 
-                question, ticker = self.parse_query(user_input)
+                question, ticker, filters = self.parse_query(user_input)
+                
+                if self.engine.sessions.get(self.session.session_id) is None:
+                    self.session = self.engine.sessions.create()
                 
-                result = self.engine.query(question, ticker=ticker)
+                result = self.engine.query_session(
+                    self.session, question, ticker=ticker, filters=filters
+                )
+                print(f"\n Answer: {result['answer']}")
                 
                 print("\n" + "-"*60 + "\n")
                 
@@ -3,6 +3,7 @@ Configuration file for Finance RAG Chatbot
 This stores all our settings in one place
 """
 
+import json
 import os
 from pathlib import Path
 
@@ -12,6 +13,7 @@ DATA_DIR = PROJECT_ROOT / "data"
 RAW_DATA_DIR = DATA_DIR / "raw_filings"
 PROCESSED_DATA_DIR = DATA_DIR / "processed"
 VECTOR_DB_DIR = DATA_DIR / "vector_db"
+SNAPSHOT_DIR = DATA_DIR / "snapshots"
 
 # Create directories if they don't exist
 RAW_DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -21,7 +23,83 @@ VECTOR_DB_DIR.mkdir(parents=True, exist_ok=True)
 # Model Configuration
 EMBEDDING_MODEL = "intfloat/e5-large-v2"
 LLM_MODEL = "llama3.1:8b"
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Ollama Client Configuration
+# Comma separated list of Ollama hosts, requests are balanced across them
+OLLAMA_HOSTS = [
+    host.strip()
+    for host in os.getenv("OLLAMA_HOSTS", OLLAMA_BASE_URL).split(",")
+    if host.strip()
+]
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # keep model loaded between requests
+OLLAMA_TIMEOUT = 120  # seconds
+OLLAMA_MAX_CONNECTIONS = 10  # pooled connections per host
+OLLAMA_HEALTH_CHECK_INTERVAL = 15  # seconds before retrying an unhealthy host
+
+# Vector Store Configuration
+COLLECTION_NAME = "sec_filings"  # default collection before any rebuild or swap
+ACTIVE_COLLECTION_FILE = VECTOR_DB_DIR / "active_collection.json"
+INDEX_LOCK_FILE = VECTOR_DB_DIR / "index.lock"  # held while collections are built, swapped or dropped
+
+# HNSW Index Configuration (measure trade-offs with src/hnsw_tuning.py)
+# Fixed when a collection is created; rebuild the index to apply new values
+HNSW_PARAMS = {
+    "space": "l2",
+    "M": 16,
+    "construction_ef": 100,
+    "search_ef": 10
+}
+HNSW_PARAMS_FILE = DATA_DIR / "hnsw_params.json"  # written by `hnsw_tuning.py --apply`
+if HNSW_PARAMS_FILE.exists():
+    with open(HNSW_PARAMS_FILE, 'r', encoding='utf-8') as f:
+        HNSW_PARAMS.update(json.load(f))
+
+# Index Retention (per ticker)
+RETENTION_KEEP_10K = 3
+RETENTION_KEEP_10Q = 4
+
+# Answer & Retrieval Caches
+# Answers and the query log live in QUERY_CACHE_DB, shared by all API workers;
+# retrievals are cached in each worker's memory
+QUERY_CACHE_DB = DATA_DIR / "query_cache.db"
+ANSWER_CACHE_SIZE = 1000
+RETRIEVAL_CACHE_SIZE = 2000
+QUERY_CACHE_TTL = 6 * 3600  # seconds; entries also drop when the active collection changes
+
+# Cache Pre-warming (src/prewarm.py)
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+# Asked once per company in TECH_COMPANIES
+PREWARM_TEMPLATES = [
+    "What was the total revenue and how did it change?",
+    "How did gross margin and operating margin change?",
+    "What are the main risk factors?",
+    "What are the business segments and how did each perform?",
+    "What is the outlook and guidance for the next year?"
+]
+PREWARM_TOP_QUERIES = 25  # most frequent recent questions warmed as well
+PREWARM_MIN_COUNT = 2  # times a question must be asked to count as frequent
+PREWARM_RECENT_WINDOW = 24 * 3600  # seconds of query history considered
+PREWARM_CONCURRENCY = 2  # questions warmed at once per worker
+PREWARM_INTERVAL = 3600  # seconds between passes when the collection is unchanged
+PREWARM_OFF_PEAK_HOURS = (0, 6)  # local hours [start, end) that are always off-peak
+PREWARM_IDLE_SECONDS = 120  # outside those hours, warm only after this long without user queries (any worker)
+PREWARM_LOCK_FILE = DATA_DIR / "prewarm.lock"  # only the worker holding it runs the scheduler
+
+# Background Ingestion (/ingest)
+# Jobs run in their own process so parsing and embedding never hold the API's GIL or torch threads
+INGEST_NICE = 10  # added to the job process's niceness, so queries get the CPU first
+INGEST_THREADS = 1  # torch threads the job process may use
+INGEST_CPU_FRACTION = 0.25  # share of wall time the job process may keep its core busy
+INGEST_BATCH_SIZE = 32
+INGEST_JOBS_DIR = DATA_DIR / "ingest_jobs"  # job status, readable from every API worker
+
+# API Server Configuration (src/serve.py)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", str(os.cpu_count() or 1)))
+API_THREADS_PER_WORKER = int(os.getenv("API_THREADS_PER_WORKER", "8"))  # concurrent requests per worker
+STATS_CACHE_TTL = 30  # seconds /stats is served from memory
 
 # Chunking Configuration
 CHUNK_SIZE = 1000
@@ -30,6 +108,19 @@ CHUNK_OVERLAP = 200
 # Retrieval Configuration
 TOP_K_RESULTS = 5
 
+# Hierarchical Retrieval (filing -> section -> chunk)
+HIERARCHICAL_RETRIEVAL = True
+HIERARCHY_MIN_FILINGS = 50  # below this a flat search is already cheap
+HIERARCHY_TOP_FILINGS = 8
+HIERARCHY_TOP_SECTIONS = 12
+
+# Reranking Configuration
+RERANK_ENABLED = True
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20  # vector search pool that gets rescored
+RERANK_BATCH_SIZE = 16
+RERANK_TIME_BUDGET_MS = 250  # fall back to vector order beyond this
+
 # Top 35 Tech Companies
 TECH_COMPANIES = [
     "AAPL",   # Apple
@@ -69,6 +160,55 @@ TECH_COMPANIES = [
     "SNOW",   # Snowflake
 ]
 
+# Conversation Sessions
+SESSION_MAX_SESSIONS = 500
+SESSION_IDLE_TIMEOUT = 1800  # seconds before an idle session is dropped
+SESSION_MAX_TURNS = 10  # turns kept per session
+SESSION_MAX_CONTEXT_TOKENS = 6000  # re-prefill from history beyond this
+SESSION_TURN_TIMEOUT = 300  # seconds a turn may hold its session before another can run
+
+# Company names used to recognise companies mentioned in questions
+COMPANY_NAMES = {
+    "AAPL": ["Apple"],
+    "MSFT": ["Microsoft"],
+    "NVDA": ["NVIDIA"],
+    "GOOGL": ["Alphabet", "Google"],
+    "AMZN": ["Amazon"],
+    "META": ["Meta", "Facebook"],
+    "TSLA": ["Tesla"],
+    "AVGO": ["Broadcom"],
+    "ORCL": ["Oracle"],
+    "ADBE": ["Adobe"],
+    "CRM": ["Salesforce"],
+    "CSCO": ["Cisco"],
+    "ACN": ["Accenture"],
+    "AMD": ["AMD", "Advanced Micro Devices"],
+    "IBM": ["IBM"],
+    "INTU": ["Intuit"],
+    "NOW": ["ServiceNow"],
+    "TXN": ["Texas Instruments"],
+    "QCOM": ["Qualcomm"],
+    "AMAT": ["Applied Materials"],
+    "PANW": ["Palo Alto Networks"],
+    "MU": ["Micron"],
+    "INTC": ["Intel"],
+    "ADI": ["Analog Devices"],
+    "LRCX": ["Lam Research"],
+    "KLAC": ["KLA"],
+    "SNPS": ["Synopsys"],
+    "CDNS": ["Cadence"],
+    "MCHP": ["Microchip"],
+    "NXPI": ["NXP"],
+    "MRVL": ["Marvell"],
+    "FTNT": ["Fortinet"],
+    "WDAY": ["Workday"],
+    "TEAM": ["Atlassian"],
+    "SNOW": ["Snowflake"],
+}
+
+# Financial Facts Index
+FACTS_DB_PATH = PROCESSED_DATA_DIR / "financial_facts.db"
+
 # SEC Filing Types
 FILING_TYPES = ["10-K", "10-Q"]
 
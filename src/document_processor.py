@@ -1,11 +1,82 @@
 from pathlib import Path
 from bs4 import BeautifulSoup
 import re
-from typing import List, Dict
+from typing import Callable, List, Dict
 from tqdm import tqdm
 import json
 
-from config import RAW_DATA_DIR, PROCESSED_DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP
+from config import (
+    RAW_DATA_DIR,
+    PROCESSED_DATA_DIR,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    COMPANY_NAMES
+)
+from financial_facts import FinancialFactsExtractor, FinancialFactsIndex
+
+# Headings such as "Item 1A. Risk Factors" or "ITEM 7 - Management's Discussion"
+SECTION_PATTERN = re.compile(
+    r'\bitem\s+(1a|1b|1c|7a|9a|9b|9c|1[0-6]|[1-9])\s*[\.:\-\u2013\u2014]',
+    re.IGNORECASE
+)
+
+SECTION_TITLES = {
+    '10-K': {
+        '1': 'Business',
+        '1A': 'Risk Factors',
+        '1B': 'Unresolved Staff Comments',
+        '1C': 'Cybersecurity',
+        '2': 'Properties',
+        '3': 'Legal Proceedings',
+        '4': 'Mine Safety Disclosures',
+        '5': 'Market for Common Equity',
+        '6': 'Reserved',
+        '7': "Management's Discussion and Analysis",
+        '7A': 'Quantitative and Qualitative Disclosures About Market Risk',
+        '8': 'Financial Statements and Supplementary Data',
+        '9': 'Changes in and Disagreements with Accountants',
+        '9A': 'Controls and Procedures',
+        '9B': 'Other Information',
+        '9C': 'Foreign Jurisdictions that Prevent Inspections',
+        '10': 'Directors, Executive Officers and Corporate Governance',
+        '11': 'Executive Compensation',
+        '12': 'Security Ownership',
+        '13': 'Certain Relationships and Related Transactions',
+        '14': 'Principal Accountant Fees and Services',
+        '15': 'Exhibits and Financial Statement Schedules',
+        '16': 'Form 10-K Summary',
+    },
+    # The longest occurrence of an item wins, which is the Part I meaning
+    # except for items that only exist in Part II
+    '10-Q': {
+        '1': 'Financial Statements',
+        '1A': 'Risk Factors',
+        '2': "Management's Discussion and Analysis",
+        '3': 'Quantitative and Qualitative Disclosures About Market Risk',
+        '4': 'Controls and Procedures',
+        '5': 'Other Information',
+        '6': 'Exhibits',
+    },
+}
+
+FILING_SUMMARY_WORDS = 300
+
+FISCAL_PERIODS = ('FY', 'Q1', 'Q2', 'Q3', 'Q4')
+
+def resolve_section(value: str) -> Dict[str, str]:
+    # Accepts an item code ("1A", "item 7") or a title ("risk factors") and returns
+    # the item code per filing type, since 10-K and 10-Q number their items differently
+    value = value.strip().lower().replace('-', ' ').replace('_', ' ')
+    if value.startswith('item '):
+        value = value[len('item '):]
+
+    codes = {}
+    for filing_type, titles in SECTION_TITLES.items():
+        exact = [code for code, title in titles.items() if value in (code.lower(), title.lower())]
+        partial = [code for code, title in titles.items() if value in title.lower()]
+        if exact or partial:
+            codes[filing_type] = (exact or partial)[0]
+    return codes
 
 class DocumentProcessor:
     
@@ -13,6 +84,10 @@ class DocumentProcessor:
         print(" Document Processor initialized")
         self.chunk_size = CHUNK_SIZE
         self.chunk_overlap = CHUNK_OVERLAP
+        self.facts_extractor = FinancialFactsExtractor()
+        self.facts = []
+        self.sections = []
+        self.filings = []
     
     def clean_html(self, html_content: str) -> str:
         soup = BeautifulSoup(html_content, 'lxml')
@@ -70,14 +145,132 @@ class DocumentProcessor:
         
         return metadata
     
+    def extract_filing_date(self, file_path: Path) -> int:
+        # sec-edgar-downloader keeps the SEC header next to the primary document
+        submission_file = file_path.parent / "full-submission.txt"
+        if not submission_file.exists():
+            return 0
+        
+        with open(submission_file, 'r', encoding='utf-8', errors='ignore') as f:
+            header = f.read(4096)
+        
+        match = re.search(r'FILED AS OF DATE:\s*(\d{8})', header)
+        return int(match.group(1)) if match else 0
+    
+    def extract_period_metadata(self, document_info: Dict, file_path: Path,
+                                filing_type: str) -> Dict:
+        fiscal_year = document_info.get('fiscal_year', '')
+        fiscal_period = document_info.get('fiscal_period', '').upper()
+        if fiscal_period not in FISCAL_PERIODS:
+            fiscal_period = 'FY' if filing_type == '10-K' else ''
+        
+        # Stored as integers so they can be range-filtered
+        return {
+            'filing_date': self.extract_filing_date(file_path),
+            'fiscal_year': int(fiscal_year) if fiscal_year.isdigit() else 0,
+            'fiscal_period': fiscal_period
+        }
+    
+    def split_sections(self, text: str, filing_type: str) -> List[Dict]:
+        matches = list(SECTION_PATTERN.finditer(text))
+        titles = SECTION_TITLES.get(filing_type, SECTION_TITLES['10-K'])
+        
+        # Each item is listed in the table of contents and again as a heading,
+        # keep the occurrence that starts the longest span
+        best = {}
+        for i, match in enumerate(matches):
+            code = match.group(1).upper()
+            if code not in titles:
+                continue
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            if code not in best or end - match.start() > best[code][1] - best[code][0]:
+                best[code] = (match.start(), end)
+        
+        starts = sorted((start, code) for code, (start, _) in best.items())
+        if not starts:
+            return [{'section': 'ALL', 'section_title': 'Full Filing', 'text': text}]
+        
+        sections = []
+        if starts[0][0] > 0:
+            sections.append({
+                'section': 'COVER',
+                'section_title': 'Cover Page and Contents',
+                'text': text[:starts[0][0]]
+            })
+        
+        for j, (start, code) in enumerate(starts):
+            end = starts[j + 1][0] if j + 1 < len(starts) else len(text)
+            sections.append({
+                'section': code,
+                'section_title': titles[code],
+                'text': text[start:end]
+            })
+        
+        return sections
+    
+    def build_filing_summary(self, metadata: Dict, sections: List[Dict]) -> str:
+        company = ', '.join(COMPANY_NAMES.get(metadata['ticker'], []))
+        titles = '; '.join(section['section_title'] for section in sections)
+        
+        # The business overview says most about what a filing covers
+        lead = next(
+            (section['text'] for section in sections if section['section'] in ('1', '2')),
+            sections[0]['text']
+        )
+        lead_words = ' '.join(lead.split()[:FILING_SUMMARY_WORDS])
+        
+        return (
+            f"{company} ({metadata['ticker']}) {metadata['filing_type']} filing. "
+            f"Sections: {titles}. {lead_words}"
+        )
+    
     def process_file(self, file_path: Path) -> List[Dict]:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 html_content = f.read()
             
             metadata = self.extract_metadata(file_path)
+            xbrl = self.facts_extractor.parse(html_content)
+            metadata.update(self.extract_period_metadata(
+                self.facts_extractor.extract_document_info(xbrl),
+                file_path,
+                metadata['filing_type']
+            ))
             clean_text = self.clean_html(html_content)
-            chunks = self.chunk_text(clean_text, metadata)
+            sections = self.split_sections(clean_text, metadata['filing_type'])
+            
+            chunks = []
+            for section in sections:
+                section_id = f"{metadata['accession_number']}:{section['section']}"
+                section_metadata = {
+                    **metadata,
+                    'section': section['section'],
+                    'section_title': section['section_title'],
+                    'section_id': section_id
+                }
+                section_chunks = self.chunk_text(section['text'], section_metadata)
+                if not section_chunks:
+                    continue
+                
+                chunks.extend(section_chunks)
+                self.sections.append({
+                    'section_id': section_id,
+                    'text': f"{section['section_title']}: {' '.join(section['text'].split()[:FILING_SUMMARY_WORDS])}",
+                    'metadata': section_metadata
+                })
+            
+            # chunk_id stays unique across the whole filing
+            for chunk_id, chunk in enumerate(chunks):
+                chunk['metadata']['chunk_id'] = chunk_id
+            
+            if chunks:
+                self.filings.append({
+                    'text': self.build_filing_summary(metadata, sections),
+                    'metadata': metadata
+                })
+            
+            # Reported figures tagged with inline XBRL, for instant numeric answers
+            self.facts.extend(self.facts_extractor.extract(xbrl, metadata))
             
             return chunks
             
@@ -85,7 +278,9 @@ class DocumentProcessor:
             print(f" Error processing {file_path.name}: {str(e)}")
             return []
     
-    def process_all_filings(self) -> List[Dict]:
+    def process_all_filings(self, progress: Callable[[int, int], None] = None,
+                            pause: Callable[[], None] = None,
+                            facts_db: Path = None) -> List[Dict]:
         print(f"\n{'='*60}")
         print(" Processing SEC Filings")
         print(f"{'='*60}\n")
@@ -100,20 +295,44 @@ class DocumentProcessor:
         print(f" Found {len(html_files)} HTML files")
         
         all_chunks = []
+        self.facts = []
+        self.sections = []
+        self.filings = []
         
-        for file_path in tqdm(html_files, desc="Processing files"):
+        for done, file_path in enumerate(tqdm(html_files, desc="Processing files"), 1):
             chunks = self.process_file(file_path)
             all_chunks.extend(chunks)
+            
+            if progress:
+                progress(done, len(html_files))
+            if pause:
+                pause()
         
         output_file = PROCESSED_DATA_DIR / "processed_chunks.json"
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(all_chunks, f, indent=2)
         
+        # Section and filing records feed the hierarchical retrieval index
+        with open(PROCESSED_DATA_DIR / "processed_sections.json", 'w', encoding='utf-8') as f:
+            json.dump(self.sections, f, indent=2)
+        with open(PROCESSED_DATA_DIR / "processed_filings.json", 'w', encoding='utf-8') as f:
+            json.dump(self.filings, f, indent=2)
+        
+        with open(PROCESSED_DATA_DIR / "processed_facts.json", 'w', encoding='utf-8') as f:
+            json.dump(self.facts, f)
+        
+        # Facts belong to the collection the chunks are indexed into, which is a new one:
+        # the live collection's facts never change under a running API
+        if facts_db:
+            FinancialFactsIndex(facts_db).add_facts(self.facts)
+        
         print(f"\n{'='*60}")
         print(" PROCESSING SUMMARY")
         print(f"{'='*60}")
         print(f" Files processed: {len(html_files)}")
         print(f" Total chunks created: {len(all_chunks)}")
+        print(f" Sections indexed: {len(self.sections)}")
+        print(f" Financial facts indexed: {len(self.facts)}")
         print(f" Saved to: {output_file}")
         print(f"{'='*60}\n")
         
@@ -0,0 +1,394 @@
+from bs4 import BeautifulSoup, SoupStrainer
+from datetime import date
+from pathlib import Path
+from typing import List, Dict, Optional
+import re
+import sqlite3
+
+from config import FACTS_DB_PATH, COMPANY_NAMES, COLLECTION_NAME
+
+# Reported figures we index, in order of preference per metric
+FACT_CONCEPTS = {
+    'revenue': [
+        'us-gaap:Revenues',
+        'us-gaap:RevenueFromContractWithCustomerExcludingAssessedTax',
+        'us-gaap:SalesRevenueNet'
+    ],
+    'net_income': ['us-gaap:NetIncomeLoss'],
+    'eps_diluted': ['us-gaap:EarningsPerShareDiluted'],
+    'eps_basic': ['us-gaap:EarningsPerShareBasic'],
+    'operating_expenses': ['us-gaap:OperatingExpenses', 'us-gaap:CostsAndExpenses'],
+}
+
+CONCEPT_METRICS = {
+    concept: metric
+    for metric, concepts in FACT_CONCEPTS.items()
+    for concept in concepts
+}
+
+DOCUMENT_INFO_TAGS = {
+    'dei:DocumentFiscalYearFocus': 'fiscal_year',
+    'dei:DocumentFiscalPeriodFocus': 'fiscal_period',
+    'dei:DocumentPeriodEndDate': 'period_end_date',
+}
+
+SEGMENT_AXIS = 'us-gaap:StatementBusinessSegmentsAxis'
+
+METRIC_LABELS = {
+    'revenue': 'total revenue',
+    'net_income': 'net income',
+    'eps_diluted': 'diluted earnings per share',
+    'eps_basic': 'basic earnings per share',
+    'operating_expenses': 'operating expenses',
+}
+
+# Phrases naming a metric, longest first so "net sales" wins over "sales"
+METRIC_PHRASES = {
+    'diluted earnings per share': 'eps_diluted',
+    'basic earnings per share': 'eps_basic',
+    'earnings per share': 'eps_diluted',
+    'diluted eps': 'eps_diluted',
+    'basic eps': 'eps_basic',
+    'eps': 'eps_diluted',
+    'net income': 'net_income',
+    'net earnings': 'net_income',
+    'net profit': 'net_income',
+    'operating expenses': 'operating_expenses',
+    'opex': 'operating_expenses',
+    'revenues': 'revenue',
+    'revenue': 'revenue',
+    'net sales': 'revenue',
+    'total sales': 'revenue',
+}
+
+METRIC_PATTERN = re.compile(
+    r'\b(' + '|'.join(re.escape(phrase) for phrase in sorted(METRIC_PHRASES, key=len, reverse=True)) + r')\b'
+)
+
+# Only "what is/was/how much is <company>'s <metric> [in <year>/<period>]" takes the
+# fast path; any other word (policy, percentage, share, from, audit...) goes to full RAG
+LOOKUP_START = re.compile(r"^(what|what's|whats|how much)\b")
+LOOKUP_WORDS = {
+    'what', "what's", 'whats', 'how', 'much', 'is', 'was', 'are', 'were', 'did', 'does',
+    'report', 'reported', 'the', 'its', 'their', 'total', 'net', 'consolidated',
+    'in', 'for', 'during', 'fiscal', 'year', 'full', 'annual', 'quarter', 'quarterly',
+    'latest', 'most', 'recent', 'last', 'segment'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    ticker TEXT NOT NULL,
+    filing_type TEXT NOT NULL,
+    accession_number TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    concept TEXT NOT NULL,
+    segment TEXT NOT NULL DEFAULT '',
+    period_start TEXT,
+    period_end TEXT NOT NULL,
+    value REAL NOT NULL,
+    unit TEXT,
+    PRIMARY KEY (accession_number, metric, segment, period_start, period_end)
+);
+CREATE INDEX IF NOT EXISTS idx_facts_lookup
+    ON facts (ticker, metric, segment, period_end);
+"""
+
+def split_member_name(member: str) -> str:
+    # msft:IntelligentCloudMember -> Intelligent Cloud
+    local_name = member.split(':')[-1]
+    if local_name.endswith('Member'):
+        local_name = local_name[:-len('Member')]
+    return re.sub(r'(?<=[a-z0-9])(?=[A-Z])', ' ', local_name).strip()
+
+class FinancialFactsExtractor:
+
+    def parse_contexts(self, soup: BeautifulSoup) -> Dict[str, Dict]:
+        contexts = {}
+        for context in soup.find_all('xbrli:context'):
+            start = context.find('xbrli:startdate')
+            end = context.find('xbrli:enddate')
+            instant = context.find('xbrli:instant')
+            members = context.find_all('xbrldi:explicitmember')
+
+            contexts[context.get('id')] = {
+                'period_start': start.get_text(strip=True) if start else None,
+                'period_end': (end or instant).get_text(strip=True) if (end or instant) else None,
+                'dimensions': {
+                    member.get('dimension'): member.get_text(strip=True)
+                    for member in members
+                }
+            }
+        return contexts
+
+    def parse_value(self, tag) -> Optional[float]:
+        text = tag.get_text(strip=True)
+        number_format = tag.get('format', '').replace('-', '')
+        if number_format.endswith('fixedzero') or text in ('-', '—', '–'):
+            return 0.0
+
+        text = text.replace('$', '').replace(' ', '').strip('()')
+        if number_format.endswith('numcommadecimal'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+        try:
+            value = float(text)
+        except ValueError:
+            return None
+
+        value *= 10 ** int(tag.get('scale', 0) or 0)
+        if tag.get('sign') == '-':
+            value = -value
+        return value
+
+    def parse(self, html_content: str) -> BeautifulSoup:
+        # Only the XBRL tags are kept, which is far cheaper than a full parse
+        strainer = SoupStrainer(['ix:nonfraction', 'ix:nonnumeric', 'xbrli:context'])
+        return BeautifulSoup(html_content, 'lxml', parse_only=strainer)
+
+    def extract_document_info(self, soup: BeautifulSoup) -> Dict:
+        info = {}
+        for tag in soup.find_all('ix:nonnumeric'):
+            name = tag.get('name', '')
+            if name in DOCUMENT_INFO_TAGS:
+                info[DOCUMENT_INFO_TAGS[name]] = tag.get_text(strip=True)
+        return info
+
+    def extract(self, soup: BeautifulSoup, metadata: Dict) -> List[Dict]:
+        contexts = self.parse_contexts(soup)
+
+        facts = []
+        for tag in soup.find_all('ix:nonfraction'):
+            concept = tag.get('name')
+            metric = CONCEPT_METRICS.get(concept)
+            context = contexts.get(tag.get('contextref'))
+            if not metric or not context or not context['period_end']:
+                continue
+
+            # Consolidated figures, plus revenue broken down by business segment
+            dimensions = context['dimensions']
+            if not dimensions:
+                segment = ''
+            elif metric == 'revenue' and list(dimensions) == [SEGMENT_AXIS]:
+                segment = split_member_name(dimensions[SEGMENT_AXIS])
+            else:
+                continue
+
+            value = self.parse_value(tag)
+            if value is None:
+                continue
+
+            facts.append({
+                'ticker': metadata['ticker'],
+                'filing_type': metadata['filing_type'],
+                'accession_number': metadata['accession_number'],
+                'metric': metric,
+                'concept': concept,
+                'segment': segment,
+                'period_start': context['period_start'],
+                'period_end': context['period_end'],
+                'value': value,
+                'unit': tag.get('unitref')
+            })
+
+        return facts
+
+def facts_db_path(collection_name: str) -> Path:
+    # Each collection has its own facts table, so facts swap and roll back with it.
+    # The default collection keeps the original file.
+    if collection_name == COLLECTION_NAME:
+        return FACTS_DB_PATH
+    return FACTS_DB_PATH.with_name(f"financial_facts_{collection_name}.db")
+
+class FinancialFactsIndex:
+
+    def __init__(self, db_path=FACTS_DB_PATH, read_only: bool = False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self._segments = {}
+
+    def connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        else:
+            conn = sqlite3.connect(str(self.db_path))
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def available(self) -> bool:
+        return self.db_path.exists()
+
+    def add_facts(self, facts: List[Dict]):
+        # Preferred concepts go first so they win the primary key
+        facts = sorted(facts, key=lambda f: FACT_CONCEPTS[f['metric']].index(f['concept']))
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            accessions = {fact['accession_number'] for fact in facts}
+            conn.executemany(
+                "DELETE FROM facts WHERE accession_number = ?",
+                [(accession,) for accession in accessions]
+            )
+            conn.executemany(
+                """INSERT OR IGNORE INTO facts
+                   (ticker, filing_type, accession_number, metric, concept, segment,
+                    period_start, period_end, value, unit)
+                   VALUES (:ticker, :filing_type, :accession_number, :metric, :concept,
+                           :segment, :period_start, :period_end, :value, :unit)""",
+                facts
+            )
+        self._segments = {}
+
+    def delete_filings(self, accessions: List[str]):
+        if not self.available():
+            return
+        with self.connect() as conn:
+            conn.executemany(
+                "DELETE FROM facts WHERE accession_number = ?",
+                [(accession,) for accession in accessions]
+            )
+        self._segments = {}
+
+    def segments(self, ticker: str) -> List[str]:
+        if ticker not in self._segments:
+            with self.connect() as conn:
+                rows = conn.execute(
+                    "SELECT DISTINCT segment FROM facts WHERE ticker = ? AND metric = 'revenue' AND segment != ''",
+                    (ticker,)
+                ).fetchall()
+            self._segments[ticker] = [row['segment'] for row in rows]
+        return self._segments[ticker]
+
+    def lookup(self, ticker: str, metric: str, segment: str = '',
+               year: str = None, prefer_annual: bool = None) -> Optional[Dict]:
+        query = "SELECT * FROM facts WHERE ticker = ? AND metric = ? AND segment = ?"
+        params = [ticker, metric, segment]
+        if year:
+            query += " AND period_end LIKE ?"
+            params.append(f"{year}%")
+        query += " ORDER BY period_end DESC LIMIT 20"
+
+        with self.connect() as conn:
+            rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+        if not rows:
+            return None
+
+        for row in rows:
+            row['days'] = self._period_days(row)
+        if prefer_annual is not None:
+            matching = [row for row in rows if (row['days'] >= 300) == prefer_annual]
+            rows = matching or rows
+
+        # Latest period; a 10-K reports the full year, a 10-Q the quarter
+        latest = [row for row in rows if row['period_end'] == rows[0]['period_end']]
+        if latest[0]['filing_type'] == '10-K':
+            return max(latest, key=lambda row: row['days'])
+        return min(latest, key=lambda row: row['days'])
+
+    def _period_days(self, row: Dict) -> int:
+        if not row['period_start']:
+            return 0
+        return (date.fromisoformat(row['period_end']) - date.fromisoformat(row['period_start'])).days
+
+    def detect_tickers(self, question: str) -> List[str]:
+        found = []
+        for ticker, names in COMPANY_NAMES.items():
+            if re.search(rf'\b{ticker}\b', question) or any(
+                re.search(rf'\b{re.escape(name.lower())}\b', question.lower())
+                for name in names
+            ):
+                found.append(ticker)
+        return found
+
+    def _lookup_metric(self, text: str, ticker: str, segment: str) -> Optional[str]:
+        # The metric, or None unless the question is nothing but a plain figure lookup
+        if not LOOKUP_START.search(text) or text.startswith('how much of'):
+            return None
+        metrics = {METRIC_PHRASES[phrase] for phrase in METRIC_PATTERN.findall(text)}
+        if len(metrics) != 1:
+            return None
+
+        rest = METRIC_PATTERN.sub(' ', text)
+        if segment and metrics == {'revenue'}:
+            rest = rest.replace(segment.lower(), ' ')
+        for name in [ticker] + COMPANY_NAMES.get(ticker, []):
+            rest = re.sub(rf"\b{re.escape(name.lower())}(?:'s|')?(?=\W|$)", ' ', rest)
+        rest = re.sub(r'\b(19|20)\d{2}\b', ' ', rest)
+
+        words = re.findall(r"[a-z0-9']+", rest)
+        if any(word not in LOOKUP_WORDS for word in words):
+            return None
+        return metrics.pop()
+
+    def format_value(self, value: float, unit: str) -> str:
+        if unit and 'share' in unit.lower():
+            return f"${value:,.2f} per share"
+        magnitude = abs(value)
+        if magnitude >= 1e9:
+            return f"${value / 1e9:,.2f} billion"
+        if magnitude >= 1e6:
+            return f"${value / 1e6:,.1f} million"
+        return f"${value:,.0f}"
+
+    def answer(self, question: str, ticker: str = None) -> Optional[Dict]:
+        if not self.available():
+            return None
+
+        tickers = [ticker] if ticker else self.detect_tickers(question)
+        if len(tickers) != 1:
+            return None
+        ticker = tickers[0]
+
+        text = question.lower().replace('’', "'").strip().rstrip('?.!').strip()
+        segment = next(
+            (name for name in self.segments(ticker) if name.lower() in text),
+            ''
+        )
+        metric = self._lookup_metric(text, ticker, segment)
+        if not metric:
+            return None
+        if metric != 'revenue':
+            segment = ''
+        elif not segment and re.search(r'\bsegment\b', text):
+            return None
+
+        year_match = re.search(r'\b(19|20)\d{2}\b', text)
+        prefer_annual = None
+        if re.search(r'\b(quarter|quarterly|q[1-4])\b', text):
+            prefer_annual = False
+        elif re.search(r'\b(annual|annually|fiscal year|full year|year)\b', text):
+            prefer_annual = True
+
+        fact = self.lookup(
+            ticker, metric, segment,
+            year=year_match.group(0) if year_match else None,
+            prefer_annual=prefer_annual
+        )
+        if not fact:
+            return None
+
+        label = f"{segment} segment revenue" if segment else METRIC_LABELS[metric]
+        if fact['period_start']:
+            period = f"the period {fact['period_start']} to {fact['period_end']}"
+        else:
+            period = f"{fact['period_end']}"
+        value = self.format_value(fact['value'], fact['unit'])
+
+        answer = (
+            f"{ticker} reported {label} of {value} for {period}, "
+            f"according to its {fact['filing_type']} filing (accession {fact['accession_number']})."
+        )
+        source = {
+            'text': f"{fact['concept']} = {fact['value']:,} {fact['unit'] or ''} "
+                    f"({fact['period_start'] or ''} to {fact['period_end']})".strip(),
+            'ticker': ticker,
+            'filing_type': fact['filing_type'],
+            'accession': fact['accession_number'],
+            'metadata': fact
+        }
+
+        return {
+            'question': question,
+            'answer': answer,
+            'sources': [source],
+            'fast_path': 'financial_facts'
+        }
@@ -0,0 +1,235 @@
+"""
+HNSW tuning harness
+Measure recall@k, query latency and index memory of HNSW settings against exact search
+"""
+
+import chromadb
+from chromadb.config import Settings
+from typing import Dict, List, Set, Tuple
+from tqdm import tqdm
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+import hnswlib
+import numpy as np
+
+from config import (
+    VECTOR_DB_DIR,
+    EMBEDDING_MODEL,
+    TOP_K_RESULTS,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
+    HNSW_PARAMS,
+    HNSW_PARAMS_FILE
+)
+from vector_store import get_active_collection_name
+
+DEFAULT_M = [8, 16, 32]
+DEFAULT_CONSTRUCTION_EF = [100, 200]
+DEFAULT_SEARCH_EF = [10, 20, 40, 80, 160]
+# The engine pulls RERANK_CANDIDATES chunks per query when reranking
+DEFAULT_K = RERANK_CANDIDATES if RERANK_ENABLED else TOP_K_RESULTS
+
+def load_embeddings(limit: int = None, page_size: int = 1000) -> np.ndarray:
+    client = chromadb.PersistentClient(
+        path=str(VECTOR_DB_DIR),
+        settings=Settings(anonymized_telemetry=False)
+    )
+    collection = client.get_collection(get_active_collection_name())
+    total = min(collection.count(), limit or collection.count())
+
+    pages = []
+    with tqdm(total=total, desc="Loading embeddings") as pbar:
+        offset = 0
+        while offset < total:
+            page = collection.get(
+                limit=min(page_size, total - offset),
+                offset=offset,
+                include=['embeddings']
+            )
+            if not page['ids']:
+                break
+            pages.append(np.asarray(page['embeddings'], dtype=np.float32))
+            offset += len(page['ids'])
+            pbar.update(len(page['ids']))
+
+    if not pages:
+        raise ValueError(f"Collection '{collection.name}' is empty")
+    return np.vstack(pages)
+
+def encode_queries(path: str) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+
+    with open(path, 'r', encoding='utf-8') as f:
+        questions = [line.strip() for line in f if line.strip()]
+    print(f" Encoding {len(questions)} queries with {EMBEDDING_MODEL}...")
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    return model.encode([f"query: {question}" for question in questions]).astype(np.float32)
+
+def split_queries(data: np.ndarray, num_queries: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    # Held out of the corpus, otherwise every query trivially finds itself
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(data), size=min(num_queries, len(data) // 10), replace=False)
+    mask = np.ones(len(data), dtype=bool)
+    mask[held_out] = False
+    return data[mask], data[held_out]
+
+def exact_neighbors(data: np.ndarray, queries: np.ndarray, k: int, space: str,
+                    block_size: int = 256) -> List[Set[int]]:
+    if space == "cosine":
+        data = data / np.linalg.norm(data, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    data_norms = (data ** 2).sum(axis=1)
+
+    neighbors = []
+    for start in range(0, len(queries), block_size):
+        block = queries[start:start + block_size]
+        scores = block @ data.T
+        if space == "l2":
+            # Ranking by -||q - d||^2; the ||q||^2 term is the same for every d
+            scores = 2 * scores - data_norms
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        neighbors.extend(set(row.tolist()) for row in top)
+    return neighbors
+
+def build_hnsw(data: np.ndarray, space: str, m: int, construction_ef: int) -> Tuple[hnswlib.Index, float]:
+    # chroma-hnswlib is the index Chroma itself builds from these settings
+    index = hnswlib.Index(space=space, dim=data.shape[1])
+    start = time.perf_counter()
+    index.init_index(max_elements=len(data), ef_construction=construction_ef, M=m)
+    index.add_items(data, np.arange(len(data)))
+    build_seconds = time.perf_counter() - start
+    # Queries are served one at a time per request
+    index.set_num_threads(1)
+    return index, build_seconds
+
+def index_memory_bytes(index: hnswlib.Index) -> int:
+    # The saved file holds the vectors plus every graph level, as kept in memory
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "index.bin")
+        index.save_index(path)
+        return os.path.getsize(path)
+
+def evaluate(index: hnswlib.Index, queries: np.ndarray, truth: List[Set[int]],
+             k: int, search_ef: int) -> Dict:
+    index.set_ef(search_ef)
+    timings = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        labels, _ = index.knn_query(query, k=k)
+        timings.append(time.perf_counter() - start)
+        hits += len(expected & set(labels[0].tolist()))
+    return {
+        'recall': hits / (k * len(queries)),
+        'p50_ms': float(np.percentile(timings, 50)) * 1000,
+        'p95_ms': float(np.percentile(timings, 95)) * 1000
+    }
+
+def pareto_front(results: List[Dict]) -> List[Dict]:
+    # Kept when no other setting is at least as good on recall, latency and memory
+    def dominates(a: Dict, b: Dict) -> bool:
+        no_worse = (a['recall'] >= b['recall'] and a['p50_ms'] <= b['p50_ms']
+                    and a['memory_bytes'] <= b['memory_bytes'])
+        better = (a['recall'] > b['recall'] or a['p50_ms'] < b['p50_ms']
+                  or a['memory_bytes'] < b['memory_bytes'])
+        return no_worse and better
+    return [
+        result for result in results
+        if not any(dominates(other, result) for other in results)
+    ]
+
+def choose(results: List[Dict], target_recall: float) -> Dict:
+    good_enough = [result for result in results if result['recall'] >= target_recall]
+    if not good_enough:
+        print(f" No setting reached recall {target_recall}, picking the most accurate")
+        return max(results, key=lambda result: (result['recall'], -result['p50_ms']))
+    return min(good_enough, key=lambda result: (result['p50_ms'], result['memory_bytes']))
+
+def run_sweep(data: np.ndarray, queries: np.ndarray, k: int, space: str,
+              m_values: List[int], construction_efs: List[int],
+              search_efs: List[int]) -> List[Dict]:
+    print(f" Computing exact top-{k} for {len(queries)} queries over {len(data)} vectors...")
+    truth = exact_neighbors(data, queries, k, space)
+
+    results = []
+    for m, construction_ef in itertools.product(m_values, construction_efs):
+        index, build_seconds = build_hnsw(data, space, m, construction_ef)
+        memory = index_memory_bytes(index)
+        for search_ef in search_efs:
+            results.append({
+                'space': space,
+                'M': m,
+                'construction_ef': construction_ef,
+                'search_ef': search_ef,
+                'build_s': build_seconds,
+                'memory_bytes': memory,
+                **evaluate(index, queries, truth, k, search_ef)
+            })
+        print(f" M={m} construction_ef={construction_ef}: built in {build_seconds:.1f}s, "
+              f"{memory / 1e6:.1f} MB")
+        del index
+    return results
+
+def print_table(results: List[Dict], front: List[Dict], chosen: Dict, k: int):
+    print(f"\n{'='*60}")
+    print(f" HNSW SETTINGS (recall@{k} vs exact search, * = Pareto optimal, > = chosen)")
+    print(f"{'='*60}")
+    print(f"   {'M':>4}{'c_ef':>6}{'s_ef':>6}{'Recall':>9}{'p50 ms':>9}{'p95 ms':>9}{'MB':>8}{'Build s':>9}")
+    for result in sorted(results, key=lambda result: (result['p50_ms'], -result['recall'])):
+        marker = ">" if result is chosen else ("*" if result in front else " ")
+        print(f" {marker} {result['M']:>4}{result['construction_ef']:>6}{result['search_ef']:>6}"
+              f"{result['recall']:>9.3f}{result['p50_ms']:>9.3f}{result['p95_ms']:>9.3f}"
+              f"{result['memory_bytes'] / 1e6:>8.1f}{result['build_s']:>9.1f}")
+    print(f"{'='*60}\n")
+
+def save_params(result: Dict):
+    params = {key: result[key] for key in ("space", "M", "construction_ef", "search_ef")}
+    with open(HNSW_PARAMS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(params, f, indent=2)
+    print(f" Saved {params} to {HNSW_PARAMS_FILE}")
+    print(" Run `python src/vector_store.py rebuild` to rebuild the active index with them")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep HNSW settings and compare them with exact search")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="Neighbors per query")
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default=HNSW_PARAMS["space"])
+    parser.add_argument("--m", type=int, nargs="+", default=DEFAULT_M)
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=DEFAULT_CONSTRUCTION_EF)
+    parser.add_argument("--search-ef", type=int, nargs="+", default=DEFAULT_SEARCH_EF)
+    parser.add_argument("--sample", type=int, help="Only use the first N indexed vectors")
+    parser.add_argument("--num-queries", type=int, default=200,
+                        help="Indexed vectors held out as queries")
+    parser.add_argument("--queries", help="Text file with one real question per line")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--apply", action="store_true",
+                        help=f"Save the chosen settings to {HNSW_PARAMS_FILE.name}")
+    args = parser.parse_args()
+
+    print(f"\n{'='*60}")
+    print(" HNSW Tuning")
+    print(f"{'='*60}\n")
+
+    data = load_embeddings(args.sample)
+    if args.queries:
+        queries = encode_queries(args.queries)
+    else:
+        data, queries = split_queries(data, args.num_queries)
+
+    results = run_sweep(data, queries, args.k, args.space,
+                        args.m, args.construction_ef, args.search_ef)
+    front = pareto_front(results)
+    chosen = choose(results, args.target_recall)
+    print_table(results, front, chosen, args.k)
+
+    print(f" Current: {HNSW_PARAMS}")
+    print(f" Chosen:  M={chosen['M']} construction_ef={chosen['construction_ef']} "
+          f"search_ef={chosen['search_ef']} (recall {chosen['recall']:.3f}, p50 {chosen['p50_ms']:.3f} ms)")
+    if args.apply:
+        save_params(chosen)
+
+if __name__ == "__main__":
+    main()
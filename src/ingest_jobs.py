@@ -0,0 +1,254 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from config import (
+    COLLECTION_NAME,
+    TECH_COMPANIES,
+    FILING_TYPES,
+    INGEST_CPU_FRACTION,
+    INGEST_BATCH_SIZE,
+    INGEST_JOBS_DIR,
+    INGEST_NICE,
+    INGEST_THREADS
+)
+from vector_store import (
+    VectorStoreManager,
+    IndexLock,
+    read_collection_pointer,
+    set_active_collection
+)
+from financial_facts import facts_db_path
+
+class CpuBudget:
+
+    def __init__(self, fraction: float = INGEST_CPU_FRACTION):
+        self.fraction = min(max(fraction, 0.05), 1.0)
+        self._mark = time.perf_counter()
+
+    def pause(self):
+        # Sleep long enough that the work since the last pause is only
+        # `fraction` of the elapsed time, leaving the rest to query serving
+        busy = time.perf_counter() - self._mark
+        time.sleep(busy * (1 - self.fraction) / self.fraction)
+        self._mark = time.perf_counter()
+
+def job_path(job_id: str) -> Path:
+    return INGEST_JOBS_DIR / f"{job_id}.json"
+
+class IngestJob:
+
+    def __init__(self, download: bool, tickers: List[str], filings_per_type: int):
+        self.job_id = uuid.uuid4().hex
+        self.download = download
+        self.tickers = tickers
+        self.filings_per_type = filings_per_type
+        self.status = 'queued'
+        self.stage = None
+        self.done = 0
+        self.total = 0
+        self.target_collection = f"{COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}"
+        self.created = time.time()
+        self.finished = None
+        self.error = None
+
+    def set_stage(self, stage: str, total: int = 0):
+        print(f" Ingest job {self.job_id}: {stage}")
+        self.stage = stage
+        self.done = 0
+        self.total = total
+        self.save()
+
+    def update(self, done: int, total: int):
+        self.done = done
+        self.total = total
+        self.save()
+
+    def save(self):
+        # Status requests may land on any API worker, and the job itself runs in
+        # its own process, so the file is the source of truth
+        INGEST_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        path = job_path(self.job_id)
+        tmp_file = path.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                **self.summary(),
+                'download': self.download,
+                'tickers': self.tickers,
+                'filings_per_type': self.filings_per_type
+            }, f)
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, job_id: str) -> Optional["IngestJob"]:
+        path = job_path(job_id)
+        if not job_id.isalnum() or not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        job = cls(saved['download'], saved['tickers'], saved['filings_per_type'])
+        for field in ('job_id', 'status', 'stage', 'done', 'total', 'target_collection',
+                      'created', 'finished', 'error'):
+            setattr(job, field, saved[field])
+        return job
+
+    def summary(self) -> Dict:
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'target_collection': self.target_collection,
+            'created': self.created,
+            'finished': self.finished,
+            'error': self.error
+        }
+
+class IngestJobManager:
+
+    def __init__(self, rag_engine):
+        self.rag_engine = rag_engine
+        self._lock = threading.Lock()
+        self._running: Optional[IngestJob] = None
+
+    def start(self, download: bool = False, tickers: List[str] = None,
+              filings_per_type: int = 2) -> IngestJob:
+        with self._lock:
+            if self._running is not None:
+                raise RuntimeError(f"Ingest job {self._running.job_id} is already running")
+            # Held until the job ends, so no compaction or import drops its shadow collection
+            index_lock = IndexLock()
+            index_lock.acquire()
+            job = IngestJob(download, tickers or TECH_COMPANIES, filings_per_type)
+            self._running = job
+        job.save()
+
+        threading.Thread(target=self._run, args=(job, index_lock), daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        job = IngestJob.load(job_id)
+        return job.summary() if job else None
+
+    def _run(self, job: IngestJob, index_lock: IndexLock):
+        # Parsing and embedding hold the GIL and every torch thread, so the job runs
+        # in a niced process of its own instead of a thread next to the queries.
+        # It inherits the index lock, which stays held if this worker dies first.
+        try:
+            process = subprocess.Popen(
+                [sys.executable, str(Path(__file__).resolve()), job.job_id],
+                pass_fds=(index_lock.fileno(),)
+            )
+            returncode = process.wait()
+
+            finished = IngestJob.load(job.job_id)
+            if finished.status not in ('succeeded', 'failed'):
+                finished.status = 'failed'
+                finished.error = f"Ingest process exited with code {returncode}"
+                finished.finished = time.time()
+                finished.save()
+            if finished.status == 'succeeded':
+                self.rag_engine.refresh_collection()
+        except Exception as e:
+            print(f" Ingest job {job.job_id} failed to start: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished = time.time()
+            job.save()
+        finally:
+            index_lock.release()
+            with self._lock:
+                self._running = None
+
+    def rollback(self) -> Dict:
+        with self._lock:
+            if self._running is not None:
+                raise RuntimeError("Cannot roll back while an ingest job is running")
+
+            with IndexLock():
+                pointer = read_collection_pointer()
+                if not pointer.get('previous'):
+                    raise RuntimeError("No previous collection to roll back to")
+
+                # The collection rolled back from becomes the new "previous"
+                pointer = set_active_collection(pointer['previous'])
+        self.rag_engine.refresh_collection()
+        return pointer
+
+def run_job(job: IngestJob):
+    # Runs in the job's own process, see IngestJobManager._run
+    import torch
+    from data_collector import SECDataCollector
+    from document_processor import DocumentProcessor
+
+    os.nice(INGEST_NICE)
+    torch.set_num_threads(INGEST_THREADS)
+
+    job.status = 'running'
+    budget = CpuBudget(INGEST_CPU_FRACTION)
+    try:
+        if job.download:
+            collector = SECDataCollector()
+            downloads = [
+                (ticker, filing_type)
+                for ticker in job.tickers
+                for filing_type in FILING_TYPES
+            ]
+            job.set_stage('downloading', len(downloads))
+            for done, (ticker, filing_type) in enumerate(downloads, 1):
+                collector.download_company_filings(ticker, filing_type, job.filings_per_type)
+                job.update(done, len(downloads))
+
+        job.set_stage('processing')
+        processor = DocumentProcessor()
+        # Facts go into the shadow collection's own table and swap together with it
+        chunks = processor.process_all_filings(
+            progress=job.update,
+            pause=budget.pause,
+            facts_db=facts_db_path(job.target_collection)
+        )
+        if not chunks:
+            raise RuntimeError("No chunks produced, nothing to ingest")
+
+        # New data goes into a shadow collection; queries keep using the live one
+        job.set_stage('embedding', len(chunks))
+        manager = VectorStoreManager(collection_name=job.target_collection)
+        manager.add_chunks_to_vectorstore(
+            chunks,
+            batch_size=INGEST_BATCH_SIZE,
+            progress=job.update,
+            pause=budget.pause
+        )
+
+        job.set_stage('indexing hierarchy')
+        manager.add_hierarchy_to_vectorstore(
+            processor.sections,
+            processor.filings,
+            pause=budget.pause
+        )
+
+        # API workers pick up the new pointer on their next request
+        job.set_stage('swapping')
+        pointer = set_active_collection(job.target_collection)
+        manager.drop_stale_collections(keep=[pointer['active'], pointer['previous']])
+
+        job.status = 'succeeded'
+        job.set_stage('done')
+    except Exception as e:
+        print(f" Ingest job {job.job_id} failed: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        job.finished = time.time()
+        job.save()
+    return job.status == 'succeeded'
+
+if __name__ == "__main__":
+    sys.exit(0 if run_job(IngestJob.load(sys.argv[1])) else 1)
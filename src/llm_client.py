@@ -0,0 +1,197 @@
+import threading
+import time
+from typing import List, Dict, Iterator, Optional
+
+import httpx
+import ollama
+
+from config import (
+    LLM_MODEL,
+    OLLAMA_HOSTS,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_TIMEOUT,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_HEALTH_CHECK_INTERVAL
+)
+
+class NoHealthyBackendError(RuntimeError):
+    pass
+
+def is_host_failure(error: Exception) -> bool:
+    # A missing model (404) or a failed load/OOM (5xx) is specific to that host,
+    # other error responses would fail the same way everywhere
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code == 404 or error.status_code >= 500
+    return True
+
+def model_names(model: str) -> List[str]:
+    # Ollama lists untagged models as "<name>:latest"
+    return [model, f"{model}:latest"] if ':' not in model else [model]
+
+class OllamaBackend:
+
+    def __init__(self, host: str):
+        self.host = host
+        self.outstanding = 0
+        self.healthy = True
+        self.last_failure = 0.0
+        self.client = self._create_client()
+
+    def _create_client(self) -> ollama.Client:
+        # One httpx client per host keeps TCP connections alive between calls
+        return ollama.Client(
+            host=self.host,
+            timeout=OLLAMA_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS
+            )
+        )
+
+    def check_health(self, model: str) -> bool:
+        try:
+            available = {entry['name'] for entry in self.client.list()['models']}
+            self.healthy = any(name in available for name in model_names(model))
+            if not self.healthy:
+                print(f" Ollama backend {self.host} does not have model {model}")
+        except Exception:
+            self.healthy = False
+        if not self.healthy:
+            self.last_failure = time.time()
+        return self.healthy
+
+class OllamaPool:
+
+    def __init__(self, hosts: List[str] = None, model: str = LLM_MODEL,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.backends = [OllamaBackend(host) for host in (hosts or OLLAMA_HOSTS)]
+        self._lock = threading.Lock()
+
+    def _acquire(self, exclude: List[OllamaBackend],
+                 preferred: Optional[str] = None) -> OllamaBackend:
+        now = time.time()
+
+        # Hosts that failed are given another chance once the interval has passed
+        for backend in self.backends:
+            if (not backend.healthy and backend not in exclude
+                    and now - backend.last_failure >= OLLAMA_HEALTH_CHECK_INTERVAL):
+                backend.check_health(self.model)
+
+        with self._lock:
+            candidates = [
+                backend for backend in self.backends
+                if backend.healthy and backend not in exclude
+            ]
+            if not candidates:
+                raise NoHealthyBackendError(
+                    f"No healthy Ollama backend available ({', '.join(self.hosts)})"
+                )
+
+            pinned = [backend for backend in candidates if backend.host == preferred]
+            backend = pinned[0] if pinned else min(candidates, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend: OllamaBackend):
+        with self._lock:
+            backend.outstanding = max(0, backend.outstanding - 1)
+
+    def _mark_failed(self, backend: OllamaBackend, error: Exception):
+        print(f" Ollama backend {backend.host} failed: {error}")
+        backend.healthy = False
+        backend.last_failure = time.time()
+
+    @property
+    def hosts(self) -> List[str]:
+        return [backend.host for backend in self.backends]
+
+    def generate(self, prompt: str, context: List[int] = None,
+                 preferred_host: str = None, fallback_prompt: str = None,
+                 **kwargs) -> Dict:
+        tried = []
+        while True:
+            backend = self._acquire(tried, preferred_host)
+            try:
+                response = backend.client.generate(
+                    model=self.model,
+                    prompt=prompt,
+                    context=context,
+                    keep_alive=self.keep_alive,
+                    **kwargs
+                )
+                response['host'] = backend.host
+                return response
+            except Exception as e:
+                if not is_host_failure(e):
+                    raise
+                self._mark_failed(backend, e)
+                tried.append(backend)
+                # A conversation context only exists on the host that produced it;
+                # without it the prompt has to carry the conversation itself
+                if preferred_host and context:
+                    context = None
+                    prompt = fallback_prompt or prompt
+                preferred_host = None
+            finally:
+                self._release(backend)
+
+    def generate_stream(self, prompt: str, context: List[int] = None,
+                        preferred_host: str = None, fallback_prompt: str = None,
+                        **kwargs) -> Iterator[Dict]:
+        tried = []
+        while True:
+            backend = self._acquire(tried, preferred_host)
+            started = False
+            try:
+                for part in backend.client.generate(
+                    model=self.model,
+                    prompt=prompt,
+                    context=context,
+                    keep_alive=self.keep_alive,
+                    stream=True,
+                    **kwargs
+                ):
+                    started = True
+                    part['host'] = backend.host
+                    yield part
+                return
+            except Exception as e:
+                if not is_host_failure(e):
+                    raise
+                self._mark_failed(backend, e)
+                # Tokens already handed to the caller cannot be replayed elsewhere
+                if started:
+                    raise
+                tried.append(backend)
+                if preferred_host and context:
+                    context = None
+                    prompt = fallback_prompt or prompt
+                preferred_host = None
+            finally:
+                self._release(backend)
+
+    def warm_up(self):
+        # An empty prompt loads the model without generating anything
+        for backend in self.backends:
+            try:
+                backend.client.generate(
+                    model=self.model,
+                    prompt="",
+                    keep_alive=self.keep_alive
+                )
+                backend.healthy = True
+                print(f" Ollama connected at {backend.host}! Using model: {self.model}")
+            except Exception as e:
+                self._mark_failed(backend, e)
+
+    def status(self) -> List[Dict]:
+        return [
+            {
+                'host': backend.host,
+                'healthy': backend.healthy,
+                'outstanding': backend.outstanding
+            }
+            for backend in self.backends
+        ]
@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import fcntl
+import threading
+import time
+
+from config import (
+    TECH_COMPANIES,
+    TOP_K_RESULTS,
+    PREWARM_TEMPLATES,
+    PREWARM_TOP_QUERIES,
+    PREWARM_CONCURRENCY,
+    PREWARM_INTERVAL,
+    PREWARM_OFF_PEAK_HOURS,
+    PREWARM_IDLE_SECONDS,
+    PREWARM_LOCK_FILE
+)
+
+POLL_SECONDS = 30
+RETRY_SECONDS = 300
+
+class PrewarmScheduler:
+
+    def __init__(self, rag_engine, templates: List[str] = None, tickers: List[str] = None,
+                 concurrency: int = PREWARM_CONCURRENCY, interval: float = PREWARM_INTERVAL):
+        self.rag_engine = rag_engine
+        self.templates = templates or PREWARM_TEMPLATES
+        self.tickers = tickers or TECH_COMPANIES
+        self.concurrency = concurrency
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+        self.status = 'standby'
+        self.generation = None
+        self.last_pass = None
+        self.counts: Dict[str, int] = {}
+        self._llm_failed = threading.Event()
+        # An ingest, rollback or compaction swap invalidates everything warmed so far
+        rag_engine.add_collection_listener(lambda name: self._wake.set())
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Threads don't survive fork(), so every API worker starts one, but only
+        # the worker holding PREWARM_LOCK_FILE runs passes
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _acquire_leadership(self) -> bool:
+        # flock is dropped when the holder exits, so another worker takes over
+        if self._lock_file is None:
+            self._lock_file = open(PREWARM_LOCK_FILE, 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def questions(self) -> List[Dict]:
+        # Frequent questions first: they are the ones users are waiting on
+        requests = self.rag_engine.query_log.most_frequent(PREWARM_TOP_QUERIES)
+        requests += [
+            {'question': template, 'ticker': ticker, 'n_results': TOP_K_RESULTS, 'filters': {}}
+            for ticker in self.tickers
+            for template in self.templates
+        ]
+
+        unique = {}
+        for request in requests:
+            key = self.rag_engine._query_key(
+                request['question'], request['ticker'], request['n_results'], request['filters']
+            )
+            unique.setdefault(key, request)
+        return list(unique.values())
+
+    def is_off_peak(self) -> bool:
+        start, end = PREWARM_OFF_PEAK_HOURS
+        hour = time.localtime().tm_hour
+        in_window = start <= hour < end if start <= end else (hour >= start or hour < end)
+        idle = time.time() - self.rag_engine.query_log.last_seen >= PREWARM_IDLE_SECONDS
+        return in_window or idle
+
+    def _loop(self):
+        while not self._acquire_leadership():
+            if self._stop.wait(POLL_SECONDS):
+                return
+        self.status = 'idle'
+
+        # Warm right away, the cache is shared and may be empty after a restart
+        self._wake.set()
+        next_pass = time.time()
+        while not self._stop.is_set():
+            self._wake.wait(timeout=POLL_SECONDS)
+            # Notices swaps made by other processes even while no requests arrive
+            self.rag_engine.refresh_collection()
+            if self._wake.is_set() or time.time() >= next_pass:
+                self._wake.clear()
+                self.run_pass()
+                # Retry soon after an LLM outage instead of leaving the cache cold
+                retry = RETRY_SECONDS if self._llm_failed.is_set() else self.interval
+                next_pass = time.time() + min(retry, self.interval)
+
+    def _warm(self, request: Dict, generation: str) -> str:
+        while not self.is_off_peak():
+            if self._stop.is_set():
+                return 'stopped'
+            time.sleep(POLL_SECONDS)
+        # Left to the next pass, which the collection change has already scheduled
+        if self._stop.is_set() or self.rag_engine.collection_name != generation:
+            return 'stale'
+        # Once the LLM fails, the rest of the pass would only fail the same way
+        if self._llm_failed.is_set():
+            return 'skipped'
+
+        try:
+            outcome = self.rag_engine.warm(
+                request['question'],
+                request['ticker'],
+                request['n_results'],
+                request['filters']
+            )
+        except Exception as e:
+            print(f" Pre-warm failed for '{request['question']}' ({request['ticker']}): {e}")
+            outcome = 'failed'
+        if outcome == 'failed':
+            self._llm_failed.set()
+        return outcome
+
+    def run_pass(self):
+        generation = self.rag_engine.collection_name
+        requests = self.questions()
+        self.status = 'running'
+        self.generation = generation
+        self.counts = {}
+        self._llm_failed.clear()
+        print(f" Pre-warming {len(requests)} questions for '{generation}'...")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for outcome in pool.map(lambda request: self._warm(request, generation), requests):
+                self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+        self.status = 'idle'
+        self.last_pass = time.time()
+        print(f" Pre-warm pass finished in {time.perf_counter() - start:.0f}s: {self.counts}")
+
+    def summary(self) -> Dict:
+        return {
+            'status': self.status,
+            'collection': self.generation,
+            'last_pass': self.last_pass,
+            'outcomes': self.counts,
+            'answer_cache_entries': len(self.rag_engine.answer_cache),
+            'retrieval_cache_entries': len(self.rag_engine.retrieval_cache)
+        }
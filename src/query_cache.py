@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import json
+import sqlite3
+import threading
+import time
+
+from config import (
+    QUERY_CACHE_TTL,
+    QUERY_CACHE_DB,
+    ANSWER_CACHE_SIZE,
+    PREWARM_RECENT_WINDOW,
+    PREWARM_MIN_COUNT
+)
+
+# Shared by every API worker, so one pre-warm scheduler serves them all and
+# any worker can continue a conversation
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    collection TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    asked REAL NOT NULL,
+    key TEXT NOT NULL,
+    request TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queries_asked ON queries (asked);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    locked_until REAL NOT NULL DEFAULT 0,
+    state TEXT NOT NULL
+);
+"""
+
+class CacheDatabase:
+
+    def __init__(self, db_path=QUERY_CACHE_DB):
+        self.db_path = db_path
+        self._initialized = False
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        if not self._initialized:
+            # WAL lets workers read while another one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+class TTLCache:
+
+    def __init__(self, max_entries: int, ttl: float = QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Ordered by last use, so the least recently used entry is at the front
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if time.time() >= expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class SharedAnswerCache(CacheDatabase):
+    # Keys are (collection name, query key) tuples
+
+    def __init__(self, db_path=QUERY_CACHE_DB, max_entries: int = ANSWER_CACHE_SIZE,
+                 ttl: float = QUERY_CACHE_TTL):
+        super().__init__(db_path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires FROM answers WHERE key = ?",
+                (json.dumps(key),)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, key: Tuple, value: Dict):
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, collection, value, expires) VALUES (?, ?, ?, ?)",
+                (json.dumps(key), key[0], json.dumps(value), now + self.ttl)
+            )
+            conn.execute("DELETE FROM answers WHERE expires <= ?", (now,))
+            conn.execute(
+                "DELETE FROM answers WHERE key NOT IN "
+                "(SELECT key FROM answers ORDER BY expires DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def retain_collection(self, collection: str):
+        # Answers from other collections can no longer be served
+        with self.connect() as conn:
+            conn.execute("DELETE FROM answers WHERE collection != ?", (collection,))
+
+    def __len__(self) -> int:
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM answers WHERE expires > ?", (time.time(),)
+            ).fetchone()[0]
+
+class QueryLog(CacheDatabase):
+    # Recorded by every worker, so frequency and idleness cover all traffic
+
+    def __init__(self, db_path=QUERY_CACHE_DB, window: float = PREWARM_RECENT_WINDOW):
+        super().__init__(db_path)
+        self.window = window
+
+    def record(self, key: Hashable, request: Dict):
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO queries (asked, key, request) VALUES (?, ?, ?)",
+                (time.time(), json.dumps(key), json.dumps(request))
+            )
+
+    @property
+    def last_seen(self) -> float:
+        with self.connect() as conn:
+            return conn.execute("SELECT MAX(asked) FROM queries").fetchone()[0] or 0.0
+
+    def most_frequent(self, n: int, min_count: int = PREWARM_MIN_COUNT) -> List[Dict]:
+        cutoff = time.time() - self.window
+        with self.connect() as conn:
+            conn.execute("DELETE FROM queries WHERE asked < ?", (cutoff,))
+            # Latest wording of each question, so the warmed entry matches what users send
+            rows = conn.execute(
+                """SELECT (SELECT request FROM queries AS latest
+                           WHERE latest.key = queries.key
+                           ORDER BY asked DESC LIMIT 1)
+                   FROM queries
+                   GROUP BY key
+                   HAVING COUNT(*) >= ?
+                   ORDER BY COUNT(*) DESC
+                   LIMIT ?""",
+                (min_count, n)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
@@ -1,79 +1,377 @@
 from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
-import ollama
-from typing import List, Dict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import json
+import re
+import uuid
 
 from config import (
     VECTOR_DB_DIR,
     EMBEDDING_MODEL,
     LLM_MODEL,
-    TOP_K_RESULTS
+    TOP_K_RESULTS,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
+    HNSW_PARAMS,
+    HIERARCHICAL_RETRIEVAL,
+    HIERARCHY_MIN_FILINGS,
+    HIERARCHY_TOP_FILINGS,
+    HIERARCHY_TOP_SECTIONS,
+    SESSION_MAX_CONTEXT_TOKENS,
+    ACTIVE_COLLECTION_FILE,
+    RETRIEVAL_CACHE_SIZE
+)
+from llm_client import OllamaPool
+from single_flight import SingleFlight
+from reranker import CrossEncoderReranker
+from financial_facts import FinancialFactsIndex, facts_db_path
+from document_processor import resolve_section
+from sessions import ConversationSession, SessionStore
+from query_cache import TTLCache, SharedAnswerCache, QueryLog
+from vector_store import (
+    get_active_collection_name,
+    collection_hnsw_params
+)
+
+# Questions that lean on the previous turn for their subject
+FOLLOW_UP_PATTERN = re.compile(
+    r"^(and|also|what about|how about|same|compared)\b"
+    r"|\b(it|its|they|their|them|that|those|this|these|last year|previous|prior)\b"
 )
 
 class RAGEngine:
     
-    def __init__(self):
+    def __init__(self, connect: bool = True):
         print(" Initializing RAG Engine...")
         
         print(f" Loading embedding model: {EMBEDDING_MODEL}")
         self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
         print(" Embedding model loaded!")
         
+        self.reranker = CrossEncoderReranker() if RERANK_ENABLED else None
+        
+        self.inflight = SingleFlight()
+        self.sessions = SessionStore()
+        
+        # Keyed by collection name as well, so answers never outlive the index they came from
+        self.answer_cache = SharedAnswerCache()
+        self.retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE)
+        self.query_log = QueryLog()
+        self._collection_listeners: List[Callable[[str], None]] = []
+        
+        # A pre-forking server loads the models above in the parent and
+        # connects each worker separately, since sockets and SQLite handles
+        # must not be shared across fork()
+        if connect:
+            self.connect()
+    
+    def connect(self, read_only: bool = False):
         print(f" Connecting to ChromaDB...")
         self.client = chromadb.PersistentClient(
             path=str(VECTOR_DB_DIR),
-            settings=Settings(anonymized_telemetry=False)
+            settings=Settings(anonymized_telemetry=False, allow_reset=False)
         )
-        self.collection = self.client.get_collection("sec_filings")
-        print(f" Connected! Found {self.collection.count()} documents")
+        self._pointer_mtime = self._read_pointer_mtime()
+        self._read_only = read_only
+        self.connect_collections(get_active_collection_name())
         
-        print(f" Testing Ollama connection...")
-        try:
-            ollama.list()
-            print(f" Ollama connected! Using model: {LLM_MODEL}")
-        except Exception as e:
-            print(f" Ollama connection failed: {e}")
+        print(f" Connecting to Ollama...")
+        self.llm = OllamaPool(model=LLM_MODEL)
+        self.llm.warm_up()
+        if not any(backend.healthy for backend in self.llm.backends):
+            print(" Ollama connection failed on all hosts!")
             print("Make sure Ollama is running!")
     
-    def retrieve_context(self, query: str, n_results: int = TOP_K_RESULTS, 
-                        ticker: str = None) -> List[Dict]:
-        query_embedding = self.embedding_model.encode(f"query: {query}").tolist()
+    def connect_collections(self, name: str):
+        collection = self.client.get_collection(name)
         
-        where_filter = {"ticker": ticker} if ticker else None
+        # Vectors from a different model would be searched with the wrong query space
+        built_with = (collection.metadata or {}).get('embedding_model')
+        if built_with and built_with != EMBEDDING_MODEL:
+            raise ValueError(
+                f"Collection '{name}' was built with '{built_with}', "
+                f"but the engine uses '{EMBEDDING_MODEL}'"
+            )
+        print(f" Connected to '{name}'! Found {collection.count()} documents")
         
-        results = self.collection.query(
+        # Still searchable, just not with the tuned speed/recall trade-off
+        built_hnsw = collection_hnsw_params(collection)
+        if built_hnsw != HNSW_PARAMS:
+            print(f" Warning: '{name}' was built with HNSW settings {built_hnsw}, "
+                  f"config has {HNSW_PARAMS}. Run `python src/vector_store.py rebuild` to apply them")
+        
+        # Coarse levels are optional, indexes built before them only have chunks
+        sections_collection = self._get_optional_collection(f"{name}_sections")
+        filings_collection = self._get_optional_collection(f"{name}_filings")
+        
+        self.filing_count = filings_collection.count() if filings_collection else 0
+        self.collection_name = name
+        self.collection = collection
+        self.sections_collection = sections_collection
+        self.filings_collection = filings_collection
+        # Facts are swapped (and rolled back) together with their collection
+        self.facts = FinancialFactsIndex(facts_db_path(name), read_only=self._read_only)
+        if self.use_hierarchy():
+            print(f" Hierarchical retrieval enabled over {self.filing_count} filings")
+        
+        self.answer_cache.retain_collection(name)
+        self.retrieval_cache.clear()
+        for listener in self._collection_listeners:
+            listener(name)
+    
+    def add_collection_listener(self, listener: Callable[[str], None]):
+        # Called with the new name whenever the engine switches collections
+        self._collection_listeners.append(listener)
+    
+    def _read_pointer_mtime(self) -> float:
+        try:
+            return ACTIVE_COLLECTION_FILE.stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+    
+    def refresh_collection(self):
+        # Follow swaps made by index compaction, snapshot import or ingestion
+        mtime = self._read_pointer_mtime()
+        if mtime == self._pointer_mtime:
+            return
+        self._pointer_mtime = mtime
+        
+        name = get_active_collection_name()
+        if name != self.collection_name:
+            print(f" Active collection changed to '{name}'")
+            try:
+                self.connect_collections(name)
+            except Exception as e:
+                print(f" Keeping '{self.collection_name}', could not switch: {e}")
+    
+    def _get_optional_collection(self, name: str):
+        try:
+            return self.client.get_collection(name)
+        except Exception:
+            return None
+    
+    def use_hierarchy(self) -> bool:
+        return (
+            HIERARCHICAL_RETRIEVAL
+            and self.sections_collection is not None
+            and self.filing_count >= HIERARCHY_MIN_FILINGS
+        )
+    
+    @staticmethod
+    def combine_filters(*filters: Optional[Dict], operator: str = "$and") -> Optional[Dict]:
+        filters = [f for f in filters if f]
+        if not filters:
+            return None
+        if len(filters) == 1:
+            return filters[0]
+        return {operator: filters}
+    
+    def resolve_latest_accession(self, filing_filter: Optional[Dict]) -> Optional[str]:
+        if self.filings_collection is None:
+            print(" Latest-filing filter needs the filing index, ignoring it")
+            return None
+        
+        filings = self.filings_collection.get(where=filing_filter, include=['metadatas'])
+        if not filings['metadatas']:
+            return None
+        
+        latest = max(filings['metadatas'], key=lambda metadata: metadata.get('filing_date', 0))
+        return latest['accession_number']
+    
+    def build_filters(self, ticker: str = None,
+                      filters: Dict = None) -> Tuple[Optional[Dict], Optional[Dict]]:
+        # Filing-level fields narrow every index level, the section only the lower two
+        filters = filters or {}
+        
+        filing_conditions = []
+        if ticker:
+            filing_conditions.append({"ticker": ticker})
+        if filters.get('filing_type'):
+            filing_conditions.append({"filing_type": filters['filing_type'].upper()})
+        if filters.get('fiscal_year'):
+            filing_conditions.append({"fiscal_year": int(filters['fiscal_year'])})
+        if filters.get('fiscal_period'):
+            filing_conditions.append({"fiscal_period": filters['fiscal_period'].upper()})
+        filing_filter = self.combine_filters(*filing_conditions)
+        
+        if filters.get('latest'):
+            accession = self.resolve_latest_accession(filing_filter)
+            if accession:
+                filing_filter = {"accession_number": accession}
+        
+        section_filter = None
+        if filters.get('section'):
+            # The same section has a different item code in 10-Ks and 10-Qs
+            codes = resolve_section(filters['section'])
+            if filters.get('filing_type'):
+                filing_type = filters['filing_type'].upper()
+                codes = {filing_type: codes[filing_type]} if filing_type in codes else {}
+            if codes:
+                section_filter = self.combine_filters(*[
+                    {"$and": [{"filing_type": filing_type}, {"section": code}]}
+                    for filing_type, code in codes.items()
+                ], operator="$or")
+            else:
+                section_filter = {"section": filters['section']}
+        
+        return filing_filter, section_filter
+    
+    def narrow_sections(self, query_embedding: List[float], filing_filter: Optional[Dict],
+                        section_filter: Optional[Dict]) -> Optional[List[str]]:
+        filings = self.filings_collection.query(
             query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where_filter
+            n_results=HIERARCHY_TOP_FILINGS,
+            where=filing_filter,
+            include=['metadatas']
         )
+        accessions = [metadata['accession_number'] for metadata in filings['metadatas'][0]]
+        if not accessions:
+            return None
         
+        sections = self.sections_collection.query(
+            query_embeddings=[query_embedding],
+            n_results=HIERARCHY_TOP_SECTIONS,
+            where=self.combine_filters(
+                {"accession_number": {"$in": accessions}},
+                section_filter
+            ),
+            include=['metadatas']
+        )
+        section_ids = [metadata['section_id'] for metadata in sections['metadatas'][0]]
+        return section_ids or None
+    
+    def _build_chunks(self, results: Dict, index: int) -> List[Dict]:
         context_chunks = []
-        for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
+        for doc, metadata, distance in zip(results['documents'][index],
+                                           results['metadatas'][index],
+                                           results['distances'][index]):
             context_chunks.append({
                 'text': doc,
                 'ticker': metadata['ticker'],
                 'filing_type': metadata['filing_type'],
-                'accession': metadata['accession_number']
+                'accession': metadata['accession_number'],
+                'distance': distance,
+                'metadata': metadata
             })
-        
         return context_chunks
     
-    def generate_prompt(self, query: str, context_chunks: List[Dict]) -> str:
+    def _query_chunks(self, query_embeddings: List[List[float]], n_results: int,
+                      where_filter: Optional[Dict]) -> List[List[Dict]]:
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where_filter,
+            include=['documents', 'metadatas', 'distances']
+        )
+        return [self._build_chunks(results, i) for i in range(len(query_embeddings))]
+    
+    def _query_chunks_hierarchical(self, query_embedding: List[float], n_results: int,
+                                   filing_filter: Optional[Dict],
+                                   section_filter: Optional[Dict]) -> List[Dict]:
+        where_filter = self.combine_filters(filing_filter, section_filter)
+        
+        # Filings first, then their best sections, then only those sections' chunks
+        section_ids = self.narrow_sections(query_embedding, filing_filter, section_filter)
+        if section_ids:
+            chunks = self._query_chunks(
+                [query_embedding],
+                n_results,
+                self.combine_filters(where_filter, {"section_id": {"$in": section_ids}})
+            )[0]
+            if len(chunks) >= n_results:
+                return chunks
+        
+        return self._query_chunks([query_embedding], n_results, where_filter)[0]
+    
+    def search(self, queries: List[str], n_results: int = TOP_K_RESULTS,
+               ticker: str = None, offset: int = 0, rerank: bool = None,
+               filters: Dict = None) -> List[List[Dict]]:
+        if rerank is None:
+            rerank = RERANK_ENABLED
+        rerank = rerank and self.reranker is not None
+        
+        self.refresh_collection()
+        
+        # One encode call for the whole batch of queries
+        query_embeddings = self.embedding_model.encode(
+            [f"query: {query}" for query in queries]
+        ).tolist()
+        
+        filing_filter, section_filter = self.build_filters(ticker, filters)
+        
+        # Every page rescores the same top RERANK_CANDIDATES, so the order does not
+        # depend on offset and pages neither overlap nor skip results
+        wanted = offset + n_results
+        pool_size = max(RERANK_CANDIDATES, wanted) if rerank else wanted
+        
+        if self.use_hierarchy():
+            candidates = [
+                self._query_chunks_hierarchical(
+                    query_embedding, pool_size, filing_filter, section_filter
+                )
+                for query_embedding in query_embeddings
+            ]
+        else:
+            candidates = self._query_chunks(
+                query_embeddings,
+                pool_size,
+                self.combine_filters(filing_filter, section_filter)
+            )
+        
+        all_chunks = []
+        for query, context_chunks in zip(queries, candidates):
+            if rerank:
+                window = context_chunks[:RERANK_CANDIDATES]
+                context_chunks = (
+                    self.reranker.rerank(query, window, len(window))
+                    + context_chunks[RERANK_CANDIDATES:]
+                )
+            
+            all_chunks.append(context_chunks[offset:wanted])
+        
+        return all_chunks
+    
+    def retrieve_context(self, query: str, n_results: int = TOP_K_RESULTS, 
+                        ticker: str = None, rerank: bool = None,
+                        filters: Dict = None) -> List[Dict]:
+        if rerank is None:
+            rerank = RERANK_ENABLED
+        
+        self.refresh_collection()
+        key = (self.collection_name, query, ticker, n_results, rerank, self._filter_key(filters))
+        chunks = self.retrieval_cache.get(key)
+        if chunks is None:
+            chunks = self.search([query], n_results, ticker, rerank=rerank, filters=filters)[0]
+            self.retrieval_cache.put(key, chunks)
+        return chunks
+    
+    def format_context(self, context_chunks: List[Dict]) -> str:
         context_text = ""
         for i, chunk in enumerate(context_chunks, 1):
             context_text += f"\n--- Context {i} ---\n"
             context_text += f"Company: {chunk['ticker']}\n"
             context_text += f"Filing: {chunk['filing_type']}\n"
             context_text += f"Content: {chunk['text']}\n"
+        return context_text
+    
+    def generate_prompt(self, query: str, context_chunks: List[Dict],
+                        history: List[Dict] = None) -> str:
+        context_text = self.format_context(context_chunks)
+        
+        history_text = ""
+        if history:
+            history_text = "CONVERSATION SO FAR:\n"
+            for turn in history:
+                history_text += f"Q: {turn['question']}\nA: {turn['answer']}\n"
+            history_text += "\n"
         
         prompt = f"""You are a financial analyst assistant. Answer the question based on the provided SEC filing excerpts.
 
 CONTEXT FROM SEC FILINGS:
 {context_text}
 
-QUESTION: {query}
+{history_text}QUESTION: {query}
 
 INSTRUCTIONS:
 1. Answer the question using ONLY the information from the context above
@@ -82,29 +380,89 @@ INSTRUCTIONS:
 4. Use numbers and facts from the filings when available
 5. Keep your answer concise but informative
 
+ANSWER:"""
+        
+        return prompt
+    
+    def generate_followup_prompt(self, query: str, context_chunks: List[Dict]) -> str:
+        # Earlier turns are already in the model's context, only new text is sent
+        context_text = self.format_context(context_chunks)
+        
+        prompt = f"""
+
+ADDITIONAL CONTEXT FROM SEC FILINGS:
+{context_text}
+
+FOLLOW-UP QUESTION: {query}
+
+Answer the follow-up using the conversation so far and the context above, with the same instructions as before.
+
 ANSWER:"""
         
         return prompt
     
     def generate_answer(self, prompt: str) -> str:
         try:
-            response = ollama.generate(
-                model=LLM_MODEL,
-                prompt=prompt
-            )
+            response = self.llm.generate(prompt)
             return response['response']
         except Exception as e:
             return f"Error generating answer: {str(e)}"
     
-    def query(self, question: str, ticker: str = None, n_results: int = TOP_K_RESULTS) -> Dict:
+    def _stream_generation(self, prompt: str, on_token: Callable[[str], None],
+                           context: List[int] = None, preferred_host: str = None,
+                           fallback_prompt: str = None) -> Tuple[str, Optional[List[int]], Optional[str], bool]:
+        # The last value says whether generation finished; failed answers must not be cached
+        parts = []
+        new_context = None
+        host = None
+        completed = False
+        try:
+            for part in self.llm.generate_stream(
+                prompt,
+                context=context,
+                preferred_host=preferred_host,
+                fallback_prompt=fallback_prompt
+            ):
+                token = part.get('response', '')
+                if token:
+                    parts.append(token)
+                    on_token(token)
+                if part.get('done'):
+                    new_context = part.get('context')
+                    host = part.get('host')
+                    completed = True
+        except Exception as e:
+            error = f"Error generating answer: {str(e)}"
+            parts.append(error)
+            on_token(error)
+            completed = False
+        return ''.join(parts), new_context, host, completed
+    
+    def generate_answer_stream(self, prompt: str, on_token: Callable[[str], None]) -> str:
+        return self._stream_generation(prompt, on_token)[0]
+    
+    @staticmethod
+    def _filter_key(filters: Dict = None) -> Tuple:
+        return tuple(sorted((k, v) for k, v in (filters or {}).items() if v))
+    
+    def _query_key(self, question: str, ticker: str, n_results: int,
+                   filters: Dict = None) -> Tuple:
+        normalized = ' '.join(question.lower().split()).rstrip('?!. ')
+        return (normalized, ticker, n_results, self._filter_key(filters))
+    
+    def _run_query(self, question: str, ticker: str, n_results: int,
+                   on_token: Callable[[str], None], filters: Dict = None) -> Tuple[Dict, bool]:
         print(f"\n{'='*60}")
         print(f" Question: {question}")
         if ticker:
             print(f" Company Filter: {ticker}")
+        for name, value in (filters or {}).items():
+            if value:
+                print(f" {name.replace('_', ' ').title()} Filter: {value}")
         print(f"{'='*60}\n")
         
         print(" Retrieving relevant context...")
-        context_chunks = self.retrieve_context(question, n_results, ticker)
+        context_chunks = self.retrieve_context(question, n_results, ticker, filters=filters)
         print(f" Found {len(context_chunks)} relevant chunks")
         
         print("\n Sources:")
@@ -114,7 +472,8 @@ ANSWER:"""
         prompt = self.generate_prompt(question, context_chunks)
         
         print("\n Generating answer with Llama 3.1...")
-        answer = self.generate_answer(prompt)
+        # Always stream from Ollama so coalesced streaming callers see tokens live
+        answer, _, _, completed = self._stream_generation(prompt, on_token)
         
         print(f"\n{'='*60}")
         print(" ANSWER:")
@@ -126,7 +485,216 @@ ANSWER:"""
             'question': question,
             'answer': answer,
             'sources': context_chunks
-        }
+        }, completed
+    
+    def answer_from_facts(self, question: str, ticker: str = None) -> Dict:
+        try:
+            result = self.facts.answer(question, ticker)
+        except Exception as e:
+            print(f" Financial facts lookup failed: {e}")
+            return None
+        
+        if result:
+            print(f"\n Answered from financial facts index: {result['answer']}")
+        return result
+    
+    def _record_query(self, question: str, ticker: str, n_results: int, filters: Dict = None):
+        # Feeds the pre-warm scheduler's list of frequent questions
+        self.query_log.record(
+            self._query_key(question, ticker, n_results, filters),
+            {'question': question, 'ticker': ticker, 'n_results': n_results, 'filters': filters or {}}
+        )
+    
+    def _run_cached_query(self, key: Tuple, question: str, ticker: str, n_results: int,
+                          on_token: Callable[[str], None], filters: Dict = None) -> Tuple[Dict, bool]:
+        generation = self.collection_name
+        result, completed = self._run_query(question, ticker, n_results, on_token, filters)
+        if completed and self.collection_name == generation:
+            self.answer_cache.put((generation, key), result)
+        return result, completed
+    
+    def _answer_query(self, question: str, ticker: str, n_results: int,
+                      filters: Dict = None) -> Tuple[Dict, str]:
+        # Single reported figures come straight from the XBRL facts table
+        if not any((filters or {}).values()):
+            fact_result = self.answer_from_facts(question, ticker)
+            if fact_result:
+                return fact_result, 'facts'
+        
+        self.refresh_collection()
+        key = self._query_key(question, ticker, n_results, filters)
+        cached = self.answer_cache.get((self.collection_name, key))
+        if cached is not None:
+            print(f"\n Answer served from cache: {question}")
+            return {**cached, 'question': question}, 'cached'
+        
+        # Identical concurrent questions share one retrieval and one generation
+        result, completed = self.inflight.run(
+            key,
+            lambda on_token: self._run_cached_query(key, question, ticker, n_results, on_token, filters)
+        )
+        return {**result, 'question': question}, 'generated' if completed else 'failed'
+    
+    def query(self, question: str, ticker: str = None, n_results: int = TOP_K_RESULTS,
+              filters: Dict = None) -> Dict:
+        self._record_query(question, ticker, n_results, filters)
+        return self._answer_query(question, ticker, n_results, filters)[0]
+    
+    def warm(self, question: str, ticker: str = None, n_results: int = TOP_K_RESULTS,
+             filters: Dict = None) -> str:
+        # Same path as query(), but not counted as user traffic
+        return self._answer_query(question, ticker, n_results, filters)[1]
+    
+    def query_stream(self, question: str, ticker: str = None,
+                     n_results: int = TOP_K_RESULTS, filters: Dict = None) -> Iterator[Dict]:
+        self._record_query(question, ticker, n_results, filters)
+        if not any((filters or {}).values()):
+            fact_result = self.answer_from_facts(question, ticker)
+            if fact_result:
+                yield {'type': 'token', 'text': fact_result['answer']}
+                yield {'type': 'result', **fact_result}
+                return
+        
+        self.refresh_collection()
+        key = self._query_key(question, ticker, n_results, filters)
+        cached = self.answer_cache.get((self.collection_name, key))
+        if cached is not None:
+            yield {'type': 'token', 'text': cached['answer']}
+            yield {'type': 'result', **cached, 'question': question}
+            return
+        
+        flight = self.inflight.start(
+            key,
+            lambda on_token: self._run_cached_query(key, question, ticker, n_results, on_token, filters)
+        )
+        
+        for token in flight.iter_tokens():
+            yield {'type': 'token', 'text': token}
+        
+        result, _ = flight.wait()
+        yield {'type': 'result', **result, 'question': question}
+
+    def resolve_follow_up(self, session: ConversationSession, question: str,
+                          ticker: str = None, filters: Dict = None) -> Tuple[str, Optional[str], Dict]:
+        # "and what about last year?" keeps the company, filters and topic of the previous turn
+        filters = filters or {}
+        previous = session.last_question()
+        is_follow_up = (
+            previous is not None
+            and not self.facts.detect_tickers(question)
+            and (len(question.split()) <= 6 or FOLLOW_UP_PATTERN.search(question.lower()))
+        )
+        if not is_follow_up:
+            # Otherwise the request's own ticker and filters apply, even when they are empty
+            return question, ticker, filters
+        
+        if ticker is None:
+            ticker = session.ticker
+        if not any(filters.values()):
+            filters = session.filters
+        return f"{previous} {question}", ticker, filters
+    
+    def _run_session_query(self, session: ConversationSession, question: str,
+                           ticker: str, n_results: int, filters: Dict,
+                           on_token: Callable[[str], None]) -> Dict:
+        # Reloaded under the session's lease, so a turn sees the previous one on any worker
+        with self.sessions.turn(session.session_id) as session:
+            retrieval_query, ticker, filters = self.resolve_follow_up(
+                session, question, ticker, filters
+            )
+            
+            fact_result = None
+            if retrieval_query == question:
+                self._record_query(question, ticker, n_results, filters)
+                if not any(filters.values()):
+                    fact_result = self.answer_from_facts(question, ticker)
+            
+            if fact_result:
+                answer = fact_result['answer']
+                context_chunks = fact_result['sources']
+                on_token(answer)
+                # The Ollama context would not contain this answer
+                session.reset_llm_context()
+            elif not session.history:
+                # A first turn has the same prompt as a one-off query, so it shares that
+                # query's cache and its in-flight generation
+                self.refresh_collection()
+                key = self._query_key(question, ticker, n_results, filters)
+                result = self.answer_cache.get((self.collection_name, key))
+                if result is None:
+                    flight = self.inflight.start(
+                        key,
+                        lambda publish: self._run_cached_query(
+                            key, question, ticker, n_results, publish, filters
+                        )
+                    )
+                    for token in flight.iter_tokens():
+                        on_token(token)
+                    result, _ = flight.wait()
+                else:
+                    on_token(result['answer'])
+                answer = result['answer']
+                context_chunks = result['sources']
+                # No Ollama context for this answer, the next turn sends the history instead
+                session.reset_llm_context()
+            else:
+                context_chunks = self.retrieve_context(
+                    retrieval_query, n_results, ticker, filters=filters
+                )
+                
+                if session.llm_context and len(session.llm_context) > SESSION_MAX_CONTEXT_TOKENS:
+                    session.reset_llm_context()
+                
+                full_prompt = self.generate_prompt(question, context_chunks, list(session.history))
+                if session.llm_context:
+                    prompt = self.generate_followup_prompt(question, context_chunks)
+                else:
+                    prompt = full_prompt
+                
+                # full_prompt is sent instead if the host holding the context fails
+                answer, llm_context, host, _ = self._stream_generation(
+                    prompt, on_token, session.llm_context, session.llm_host, full_prompt
+                )
+                if llm_context:
+                    session.llm_context = llm_context
+                    session.llm_host = host
+                else:
+                    session.reset_llm_context()
+            
+            session.add_turn(question, answer)
+            session.ticker = ticker
+            session.filters = filters
+            session.sources = context_chunks
+            
+            return {
+                'question': question,
+                'answer': answer,
+                'sources': context_chunks,
+                'session_id': session.session_id
+            }
+    
+    def query_session(self, session: ConversationSession, question: str, ticker: str = None,
+                      n_results: int = TOP_K_RESULTS, filters: Dict = None) -> Dict:
+        # Only first turns are coalesced, later ones depend on the conversation
+        return self._run_session_query(
+            session, question, ticker, n_results, filters or {}, lambda token: None
+        )
+    
+    def query_session_stream(self, session: ConversationSession, question: str,
+                             ticker: str = None, n_results: int = TOP_K_RESULTS,
+                             filters: Dict = None) -> Iterator[Dict]:
+        # A unique key gives the turn its own worker thread and token buffer
+        flight = self.inflight.start(
+            ('session', session.session_id, uuid.uuid4().hex),
+            lambda on_token: self._run_session_query(
+                session, question, ticker, n_results, filters or {}, on_token
+            )
+        )
+        
+        for token in flight.iter_tokens():
+            yield {'type': 'token', 'text': token}
+        
+        yield {'type': 'result', **flight.wait()}
 
 def main():
     engine = RAGEngine()
@@ -0,0 +1,71 @@
+from sentence_transformers import CrossEncoder
+from typing import List, Dict
+import time
+
+from config import (
+    RERANK_MODEL,
+    RERANK_BATCH_SIZE,
+    RERANK_TIME_BUDGET_MS
+)
+
+class CrossEncoderReranker:
+
+    def __init__(self, model_name: str = RERANK_MODEL,
+                 time_budget_ms: float = RERANK_TIME_BUDGET_MS,
+                 batch_size: int = RERANK_BATCH_SIZE):
+        print(f" Loading reranking model: {model_name}")
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.time_budget = time_budget_ms / 1000
+        self.batch_size = batch_size
+        # Running estimate of seconds per (query, passage) pair
+        self.seconds_per_pair = None
+        print(" Reranking model loaded!")
+
+    def _update_estimate(self, elapsed: float, pairs: int):
+        observed = elapsed / pairs
+        if self.seconds_per_pair is None:
+            self.seconds_per_pair = observed
+        else:
+            self.seconds_per_pair = 0.8 * self.seconds_per_pair + 0.2 * observed
+
+    def rerank(self, query: str, chunks: List[Dict], top_n: int) -> List[Dict]:
+        if len(chunks) <= 1:
+            return chunks[:top_n]
+
+        # Skip the work entirely when the last runs say it cannot fit the budget
+        if (self.seconds_per_pair is not None
+                and self.seconds_per_pair * len(chunks) > self.time_budget):
+            print(" Reranking skipped: predicted to exceed time budget")
+            # Let a later query re-measure in case the machine was only busy
+            self.seconds_per_pair *= 0.9
+            return chunks[:top_n]
+
+        pairs = [(query, chunk['text']) for chunk in chunks]
+        scores = []
+        start = time.perf_counter()
+
+        for i in range(0, len(pairs), self.batch_size):
+            batch_scores = self.model.predict(
+                pairs[i:i + self.batch_size],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+            scores.extend(float(score) for score in batch_scores)
+
+            elapsed = time.perf_counter() - start
+            if elapsed > self.time_budget and len(scores) < len(pairs):
+                self._update_estimate(elapsed, len(scores))
+                print(" Reranking aborted: time budget exceeded, using vector order")
+                return chunks[:top_n]
+
+        self._update_estimate(time.perf_counter() - start, len(pairs))
+
+        ranked = sorted(
+            zip(chunks, scores),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return [
+            {**chunk, 'rerank_score': score}
+            for chunk, score in ranked[:top_n]
+        ]
@@ -0,0 +1,70 @@
+"""
+Production server for Finance RAG API
+Loads the models once in a parent process and forks workers that share them
+"""
+
+import gc
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from config import (
+    API_HOST,
+    API_PORT,
+    API_WORKERS,
+    API_THREADS_PER_WORKER
+)
+
+# api.py must not open Chroma, SQLite or Ollama connections in the parent
+os.environ["RAG_DEFER_CONNECT"] = "1"
+os.environ["API_THREADS_PER_WORKER"] = str(API_THREADS_PER_WORKER)
+
+def pre_fork(server, worker):
+    # Objects created so far are never collected, so the GC won't write to
+    # (and un-share) the pages holding the model weights
+    gc.freeze()
+
+def post_fork(server, worker):
+    import torch
+    from chromadb.api.client import SharedSystemClient
+    import api
+
+    # Split the cores between workers instead of every worker using all of them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // API_WORKERS))
+
+    # Chroma caches clients per process; drop anything inherited from the parent
+    SharedSystemClient.clear_system_cache()
+    api.rag_engine.connect(read_only=True)
+    print(f" Worker {worker.pid} ready")
+
+class RAGServer(BaseApplication):
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # With preload_app this runs once, in the parent, before forking
+        import api
+        return api.app
+
+def main():
+    print(f" Starting {API_WORKERS} workers on {API_HOST}:{API_PORT}")
+    print(f" Threads per worker: {API_THREADS_PER_WORKER}")
+
+    RAGServer({
+        'bind': f"{API_HOST}:{API_PORT}",
+        'workers': API_WORKERS,
+        'worker_class': 'uvicorn.workers.UvicornWorker',
+        'preload_app': True,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+        'timeout': 300,
+    }).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+import json
+import time
+import uuid
+
+from config import (
+    SESSION_MAX_SESSIONS,
+    SESSION_IDLE_TIMEOUT,
+    SESSION_MAX_TURNS,
+    SESSION_TURN_TIMEOUT
+)
+from query_cache import CacheDatabase
+
+LOCK_POLL_SECONDS = 0.1
+
+class ConversationSession:
+
+    def __init__(self, session_id: str = None, created: float = None, last_used: float = None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.created = created or time.time()
+        self.last_used = last_used or self.created
+        self.history = deque(maxlen=SESSION_MAX_TURNS)
+        self.ticker = None
+        self.filters = {}
+        self.sources: List[Dict] = []
+        # Token context returned by Ollama, valid only on the host that produced it.
+        # Only a speedup: the history is resent when it is missing or the host is down
+        self.llm_context: Optional[List[int]] = None
+        self.llm_host: Optional[str] = None
+
+    def last_question(self) -> Optional[str]:
+        return self.history[-1]['question'] if self.history else None
+
+    def add_turn(self, question: str, answer: str):
+        self.history.append({'question': question, 'answer': answer})
+
+    def reset_llm_context(self):
+        self.llm_context = None
+        self.llm_host = None
+
+    def state(self) -> str:
+        return json.dumps({
+            'history': list(self.history),
+            'ticker': self.ticker,
+            'filters': self.filters,
+            'sources': self.sources,
+            'llm_context': self.llm_context,
+            'llm_host': self.llm_host
+        })
+
+    @classmethod
+    def from_row(cls, row) -> "ConversationSession":
+        session_id, created, last_used, state = row
+        session = cls(session_id, created, last_used)
+        state = json.loads(state)
+        session.history.extend(state['history'])
+        session.ticker = state['ticker']
+        session.filters = state['filters']
+        session.sources = state['sources']
+        session.llm_context = state['llm_context']
+        session.llm_host = state['llm_host']
+        return session
+
+    def summary(self) -> Dict:
+        return {
+            'session_id': self.session_id,
+            'turns': len(self.history),
+            'ticker': self.ticker,
+            'idle_seconds': round(time.time() - self.last_used, 1)
+        }
+
+class SessionStore(CacheDatabase):
+    # Kept in the shared SQLite cache, so any API worker can continue a conversation
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS,
+                 idle_timeout: float = SESSION_IDLE_TIMEOUT, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+
+    def _evict(self, conn):
+        conn.execute(
+            "DELETE FROM sessions WHERE last_used < ?", (time.time() - self.idle_timeout,)
+        )
+        conn.execute(
+            "DELETE FROM sessions WHERE session_id NOT IN "
+            "(SELECT session_id FROM sessions ORDER BY last_used DESC LIMIT ?)",
+            (self.max_sessions,)
+        )
+
+    def create(self) -> ConversationSession:
+        session = ConversationSession()
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, created, last_used, state) VALUES (?, ?, ?, ?)",
+                (session.session_id, session.created, session.last_used, session.state())
+            )
+            self._evict(conn)
+        return session
+
+    def get(self, session_id: str) -> Optional[ConversationSession]:
+        now = time.time()
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT session_id, created, last_used, state FROM sessions "
+                "WHERE session_id = ? AND last_used >= ?",
+                (session_id, now - self.idle_timeout)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE sessions SET last_used = ? WHERE session_id = ?", (now, session_id))
+        session = ConversationSession.from_row(row)
+        session.last_used = now
+        return session
+
+    @contextmanager
+    def turn(self, session_id: str) -> Iterator[ConversationSession]:
+        # Turns of one conversation must run in order, even on different workers.
+        # The lease expires, so a worker that dies mid-turn doesn't block the session
+        while True:
+            now = time.time()
+            with self.connect() as conn:
+                acquired = conn.execute(
+                    "UPDATE sessions SET locked_until = ? WHERE session_id = ? AND locked_until < ?",
+                    (now + SESSION_TURN_TIMEOUT, session_id, now)
+                ).rowcount
+                exists = acquired or conn.execute(
+                    "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+            if acquired:
+                break
+            if not exists:
+                raise KeyError(f"Session {session_id} not found or expired")
+            time.sleep(LOCK_POLL_SECONDS)
+
+        session = self.get(session_id)
+        try:
+            if session is None:
+                raise KeyError(f"Session {session_id} not found or expired")
+            yield session
+            with self.connect() as conn:
+                conn.execute(
+                    "UPDATE sessions SET state = ?, last_used = ? WHERE session_id = ?",
+                    (session.state(), time.time(), session_id)
+                )
+        finally:
+            with self.connect() as conn:
+                conn.execute("UPDATE sessions SET locked_until = 0 WHERE session_id = ?", (session_id,))
+
+    def delete(self, session_id: str) -> bool:
+        with self.connect() as conn:
+            return conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            ).rowcount > 0
+
+    def __len__(self) -> int:
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE last_used >= ?",
+                (time.time() - self.idle_timeout,)
+            ).fetchone()[0]
@@ -0,0 +1,109 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Tuple
+
+class Flight:
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.tokens: List[str] = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    def publish(self, token: str):
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(self, result: Any = None, error: Exception = None):
+        with self.cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def wait(self) -> Any:
+        with self.cond:
+            while not self.done:
+                self.cond.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+    def iter_tokens(self) -> Iterator[str]:
+        # Late joiners first replay what was already generated, then follow live
+        position = 0
+        while True:
+            with self.cond:
+                while position >= len(self.tokens) and not self.done:
+                    self.cond.wait()
+                new_tokens = self.tokens[position:]
+                position = len(self.tokens)
+                finished = self.done
+
+            yield from new_tokens
+
+            if finished and position >= len(self.tokens):
+                break
+
+        if self.error:
+            raise self.error
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def _join(self, key: Hashable) -> Tuple[Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                return flight, False
+
+            flight = Flight()
+            self._flights[key] = flight
+            return flight, True
+
+    def _execute(self, key: Hashable, flight: Flight, fn: Callable[[Callable[[str], None]], Any]):
+        try:
+            result = fn(flight.publish)
+        except Exception as e:
+            self._forget(key, flight)
+            flight.finish(error=e)
+            raise
+        self._forget(key, flight)
+        flight.finish(result=result)
+        return result
+
+    def _forget(self, key: Hashable, flight: Flight):
+        # Requests arriving after completion start a fresh computation
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def run(self, key: Hashable, fn: Callable[[Callable[[str], None]], Any]) -> Any:
+        flight, is_leader = self._join(key)
+        if is_leader:
+            return self._execute(key, flight, fn)
+        return flight.wait()
+
+    def start(self, key: Hashable, fn: Callable[[Callable[[str], None]], Any]) -> Flight:
+        # Streaming callers may disconnect, so the shared work runs on its own thread
+        flight, is_leader = self._join(key)
+        if is_leader:
+            def target():
+                try:
+                    self._execute(key, flight, fn)
+                except Exception:
+                    # The error reaches every waiter through the flight
+                    pass
+
+            threading.Thread(target=target, daemon=True).start()
+        return flight
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
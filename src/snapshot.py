@@ -0,0 +1,281 @@
+"""
+Portable index snapshots
+Export the active collections to a checksummed bundle and load it on a new replica
+"""
+
+import chromadb
+from chromadb.config import Settings
+from pathlib import Path
+from typing import Dict, List
+from tqdm import tqdm
+import argparse
+import gzip
+import hashlib
+import json
+import shutil
+import sqlite3
+import time
+import numpy as np
+
+from config import (
+    VECTOR_DB_DIR,
+    SNAPSHOT_DIR,
+    EMBEDDING_MODEL,
+    COLLECTION_NAME
+)
+from vector_store import (
+    HIERARCHY_SUFFIXES,
+    get_active_collection_name,
+    set_active_collection,
+    hnsw_metadata,
+    IndexLock
+)
+from financial_facts import facts_db_path
+
+SNAPSHOT_FORMAT_VERSION = 1
+LEVELS = {"chunks": ""} | {suffix.strip("_"): suffix for suffix in HIERARCHY_SUFFIXES}
+FACTS_FILE = "financial_facts.db"
+
+class SnapshotError(Exception):
+    pass
+
+def file_checksum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_manifest(snapshot_path: Path) -> Dict:
+    manifest_file = Path(snapshot_path) / "manifest.json"
+    if not manifest_file.exists():
+        raise SnapshotError(f"No manifest found in {snapshot_path}")
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(
+            f"Unsupported snapshot format {manifest.get('format_version')}, "
+            f"expected {SNAPSHOT_FORMAT_VERSION}"
+        )
+    # Vectors from another model live in a different space and would return garbage
+    if manifest.get('embedding_model') != EMBEDDING_MODEL:
+        raise SnapshotError(
+            f"Snapshot was built with '{manifest.get('embedding_model')}', "
+            f"but this deployment uses '{EMBEDDING_MODEL}'"
+        )
+    return manifest
+
+class SnapshotManager:
+
+    def __init__(self):
+        self.client = chromadb.PersistentClient(
+            path=str(VECTOR_DB_DIR),
+            settings=Settings(anonymized_telemetry=False)
+        )
+
+    def export_level(self, collection, output_dir: Path, level: str,
+                     page_size: int = 1000) -> Dict:
+        total = collection.count()
+        embeddings_file = output_dir / f"{level}.embeddings.npy"
+        records_file = output_dir / f"{level}.records.jsonl.gz"
+
+        embeddings = None
+        written = 0
+        with gzip.open(records_file, 'wt', encoding='utf-8') as records:
+            with tqdm(total=total, desc=f"Exporting {level}") as pbar:
+                while written < total:
+                    page = collection.get(
+                        limit=page_size,
+                        offset=written,
+                        include=['embeddings', 'documents', 'metadatas']
+                    )
+                    if not page['ids']:
+                        break
+
+                    vectors = np.asarray(page['embeddings'], dtype=np.float32)
+                    if embeddings is None:
+                        # Written straight into a .npy file so replicas can memory-map it
+                        embeddings = np.lib.format.open_memmap(
+                            embeddings_file, mode='w+', dtype=np.float32,
+                            shape=(total, vectors.shape[1])
+                        )
+                    rows = min(len(vectors), total - written)
+                    embeddings[written:written + rows] = vectors[:rows]
+
+                    for record_id, document, metadata in list(zip(
+                        page['ids'], page['documents'], page['metadatas']
+                    ))[:rows]:
+                        records.write(json.dumps({
+                            'id': record_id,
+                            'document': document,
+                            'metadata': metadata
+                        }) + "\n")
+
+                    written += rows
+                    pbar.update(rows)
+
+        dimension = 0
+        if embeddings is not None:
+            dimension = embeddings.shape[1]
+            embeddings.flush()
+            del embeddings
+        else:
+            np.save(embeddings_file, np.zeros((0, 0), dtype=np.float32))
+
+        return {
+            'collection_metadata': collection.metadata,
+            'count': written,
+            'dimension': dimension,
+            'files': [embeddings_file.name, records_file.name]
+        }
+
+    def export(self, output_dir: Path = None) -> Path:
+        source_name = get_active_collection_name()
+        output_dir = Path(output_dir or SNAPSHOT_DIR / f"{source_name}_{time.strftime('%Y%m%d%H%M%S')}")
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        print(f"\n{'='*60}")
+        print(f" Exporting snapshot of '{source_name}'")
+        print(f"{'='*60}\n")
+
+        levels = {}
+        for level, suffix in LEVELS.items():
+            try:
+                collection = self.client.get_collection(f"{source_name}{suffix}")
+            except Exception:
+                continue
+            levels[level] = self.export_level(collection, output_dir, level)
+
+        if 'chunks' not in levels:
+            raise SnapshotError(f"Collection '{source_name}' does not exist")
+
+        files = [name for level in levels.values() for name in level['files']]
+        facts_db = facts_db_path(source_name)
+        if facts_db.exists():
+            # The backup API gives a consistent copy even while the table is written
+            with sqlite3.connect(str(facts_db)) as source, \
+                 sqlite3.connect(str(output_dir / FACTS_FILE)) as target:
+                source.backup(target)
+            files.append(FACTS_FILE)
+
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'source_collection': source_name,
+            'embedding_model': EMBEDDING_MODEL,
+            'levels': levels,
+            'checksums': {name: file_checksum(output_dir / name) for name in files}
+        }
+        with open(output_dir / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        size = sum((output_dir / name).stat().st_size for name in files)
+        print(f"\n Snapshot written to {output_dir} ({size / 1e6:.1f} MB)")
+        return output_dir
+
+    def verify(self, snapshot_path: Path, manifest: Dict):
+        for name, checksum in tqdm(manifest['checksums'].items(), desc="Verifying checksums"):
+            path = snapshot_path / name
+            if not path.exists():
+                raise SnapshotError(f"Snapshot file missing: {name}")
+            if file_checksum(path) != checksum:
+                raise SnapshotError(f"Checksum mismatch for {name}")
+
+    def import_level(self, snapshot_path: Path, level: str, info: Dict,
+                     collection_name: str, batch_size: int = 5000):
+        # The index is rebuilt here anyway, so it follows this deployment's HNSW settings
+        collection = self.client.create_collection(
+            name=collection_name,
+            metadata={**(info['collection_metadata'] or {}), **hnsw_metadata()}
+        )
+        if not info['count']:
+            return
+
+        # Memory-mapped, so only the batch being added is paged in
+        embeddings = np.load(snapshot_path / f"{level}.embeddings.npy", mmap_mode='r')
+
+        with gzip.open(snapshot_path / f"{level}.records.jsonl.gz", 'rt', encoding='utf-8') as f:
+            batch: List[Dict] = []
+            start = 0
+            with tqdm(total=info['count'], desc=f"Importing {level}") as pbar:
+                for line in f:
+                    batch.append(json.loads(line))
+                    if len(batch) == batch_size:
+                        self._add_batch(collection, embeddings, start, batch)
+                        start += len(batch)
+                        pbar.update(len(batch))
+                        batch = []
+                if batch:
+                    self._add_batch(collection, embeddings, start, batch)
+                    pbar.update(len(batch))
+
+    def _add_batch(self, collection, embeddings: np.ndarray, start: int, batch: List[Dict]):
+        collection.add(
+            ids=[record['id'] for record in batch],
+            embeddings=embeddings[start:start + len(batch)].tolist(),
+            documents=[record['document'] for record in batch],
+            metadatas=[record['metadata'] for record in batch]
+        )
+
+    def import_snapshot(self, snapshot_path: Path, verify: bool = True) -> str:
+        snapshot_path = Path(snapshot_path)
+        manifest = read_manifest(snapshot_path)
+        if verify:
+            self.verify(snapshot_path, manifest)
+
+        target_name = f"{COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}"
+        print(f"\n Importing snapshot {snapshot_path} into '{target_name}'...")
+
+        start = time.perf_counter()
+        with IndexLock():
+            for level, info in manifest['levels'].items():
+                self.import_level(snapshot_path, level, info, f"{target_name}{LEVELS[level]}")
+
+            # Facts belong to the imported collection and go live with the pointer swap
+            if FACTS_FILE in manifest['checksums']:
+                shutil.copyfile(snapshot_path / FACTS_FILE, facts_db_path(target_name))
+
+            set_active_collection(target_name)
+        print(f" Snapshot imported in {time.perf_counter() - start:.1f}s")
+        return target_name
+
+def bootstrap_from_snapshot(snapshot_path: Path):
+    # Always validate, so a replica never serves with a mismatched snapshot configured
+    manifest = read_manifest(Path(snapshot_path))
+
+    manager = SnapshotManager()
+    try:
+        existing = manager.client.get_collection(get_active_collection_name()).count()
+    except Exception:
+        existing = 0
+
+    if existing:
+        print(f" Index already populated, skipping snapshot {snapshot_path}")
+        return
+
+    print(f" Bootstrapping index from snapshot created {manifest['created']}")
+    manager.import_snapshot(Path(snapshot_path))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import vector store snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the active collection")
+    export_parser.add_argument("output", nargs="?", help="Snapshot directory")
+
+    import_parser = subparsers.add_parser("import", help="Load a snapshot and make it active")
+    import_parser.add_argument("snapshot", help="Snapshot directory")
+    import_parser.add_argument("--skip-verify", action="store_true",
+                               help="Skip checksum verification")
+
+    args = parser.parse_args()
+    manager = SnapshotManager()
+
+    if args.command == "export":
+        manager.export(args.output)
+    else:
+        manager.import_snapshot(args.snapshot, verify=not args.skip_verify)
+
+if __name__ == "__main__":
+    main()
@@ -3,24 +3,145 @@ import chromadb
 from chromadb.config import Settings
 import json
 from tqdm import tqdm
-from typing import List, Dict
+from typing import Callable, List, Dict, Tuple
 import time
+import os
+import argparse
+import fcntl
+import sqlite3
+import numpy as np
 
 from config import (
     PROCESSED_DATA_DIR, 
     VECTOR_DB_DIR, 
-    EMBEDDING_MODEL
+    EMBEDDING_MODEL,
+    COLLECTION_NAME,
+    ACTIVE_COLLECTION_FILE,
+    INDEX_LOCK_FILE,
+    FACTS_DB_PATH,
+    HNSW_PARAMS,
+    RETENTION_KEEP_10K,
+    RETENTION_KEEP_10Q
 )
+from financial_facts import FinancialFactsIndex, facts_db_path
+
+HIERARCHY_SUFFIXES = ("_sections", "_filings")
+# What Chroma uses for collections created without hnsw:* metadata
+CHROMA_HNSW_DEFAULTS = {"space": "l2", "M": 16, "construction_ef": 100, "search_ef": 10}
+
+def hnsw_metadata(params: Dict = None) -> Dict:
+    return {f"hnsw:{key}": value for key, value in (params or HNSW_PARAMS).items()}
+
+def collection_hnsw_params(collection) -> Dict:
+    params = dict(CHROMA_HNSW_DEFAULTS)
+    for key, value in (collection.metadata or {}).items():
+        if key.startswith("hnsw:"):
+            params[key[len("hnsw:"):]] = value
+    return params
+
+def read_collection_pointer() -> Dict:
+    if not ACTIVE_COLLECTION_FILE.exists():
+        return {'active': COLLECTION_NAME, 'previous': None}
+    with open(ACTIVE_COLLECTION_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def get_active_collection_name() -> str:
+    return read_collection_pointer()['active']
+
+def set_active_collection(name: str) -> Dict:
+    # Readers see either the old or the new pointer, never a partial file
+    pointer = {'active': name, 'previous': get_active_collection_name()}
+    tmp_file = ACTIVE_COLLECTION_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f)
+    os.replace(tmp_file, ACTIVE_COLLECTION_FILE)
+    return pointer
+
+class IndexBusyError(RuntimeError):
+    pass
+
+class IndexLock:
+    # Held by whatever builds, swaps or drops collections (ingest jobs, compaction,
+    # rebuilds, snapshot imports), so one never drops another's collection mid-build.
+    # flock works across processes and is released if the holder dies.
+    
+    def __init__(self, path=INDEX_LOCK_FILE):
+        self.path = path
+        self._file = None
+    
+    def acquire(self):
+        self._file = open(self.path, 'w')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            raise IndexBusyError("Another ingest, compaction, rebuild or snapshot import is running")
+    
+    def fileno(self) -> int:
+        # Lets a child process inherit the lock and keep it until it exits
+        return self._file.fileno()
+    
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self.release()
+
+def copy_facts(source_collection: str, target_collection: str,
+               exclude_accessions: List[str] = None):
+    source = facts_db_path(source_collection)
+    if not source.exists():
+        return
+    # The backup API gives a consistent copy even while the source is read
+    with sqlite3.connect(str(source)) as source_conn, \
+         sqlite3.connect(str(facts_db_path(target_collection))) as target_conn:
+        source_conn.backup(target_conn)
+    if exclude_accessions:
+        FinancialFactsIndex(facts_db_path(target_collection)).delete_filings(exclude_accessions)
+
+def accession_sort_key(filing: Dict) -> Tuple:
+    # 0000320193-23-000106: fall back to the year and sequence in the accession
+    parts = filing['accession_number'].split('-')
+    year, sequence = (int(parts[1]), int(parts[2])) if len(parts) == 3 else (0, 0)
+    return (filing.get('filing_date', 0), year, sequence)
+
+def directory_size(path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+def collection_disk_bytes(name: str) -> int:
+    # HNSW files live in one directory per vector segment. chroma.sqlite3 is shared
+    # with the other collections (e.g. the one kept for rollback) and is left out.
+    names = [f"{name}{suffix}" for suffix in ("",) + HIERARCHY_SUFFIXES]
+    db_file = VECTOR_DB_DIR / "chroma.sqlite3"
+    if not db_file.exists():
+        return 0
+    with sqlite3.connect(f"file:{db_file}?mode=ro", uri=True) as conn:
+        rows = conn.execute(
+            "SELECT segments.id FROM segments JOIN collections ON segments.collection = collections.id "
+            f"WHERE segments.scope = 'VECTOR' AND collections.name IN ({', '.join('?' * len(names))})",
+            names
+        ).fetchall()
+    return sum(
+        directory_size(VECTOR_DB_DIR / segment_id)
+        for (segment_id,) in rows
+        if (VECTOR_DB_DIR / segment_id).exists()
+    )
 
 class VectorStoreManager:
     
-    def __init__(self):
+    def __init__(self, collection_name: str = None, embedding_model: SentenceTransformer = None):
         print(" Initializing Vector Store Manager...")
         
-        print(f" Loading embedding model: {EMBEDDING_MODEL}")
-        print(" First time will take 2-3 minutes to download...")
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-        print(" Embedding model loaded!")
+        # Loaded on first use, index maintenance never needs it
+        self._embedding_model = embedding_model
         
         print(f" Initializing ChromaDB at: {VECTOR_DB_DIR}")
         self.client = chromadb.PersistentClient(
@@ -28,18 +149,67 @@ class VectorStoreManager:
             settings=Settings(anonymized_telemetry=False)
         )
         
-        self.collection_name = "sec_filings"
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={"description": "SEC 10-K and 10-Q filings"}
+        self.open_collection(collection_name or get_active_collection_name())
+        self.section_sums = {}
+    
+    def open_collection(self, name: str):
+        self.collection_name = name
+        self.collection = self._get_or_create(
+            self.collection_name,
+            {
+                "description": "SEC 10-K and 10-Q filings",
+                "embedding_model": EMBEDDING_MODEL
+            }
         )
         print(f" Collection '{self.collection_name}' ready!")
+        
+        # Coarse levels of the hierarchical index: one entry per section and per filing
+        self.sections_collection = self._get_or_create(
+            f"{self.collection_name}_sections",
+            {"description": "Section-level entries of SEC filings"}
+        )
+        self.filings_collection = self._get_or_create(
+            f"{self.collection_name}_filings",
+            {"description": "Filing-level summaries of SEC filings"}
+        )
+    
+    def _get_or_create(self, name: str, metadata: Dict):
+        # HNSW settings are fixed at creation, so an existing collection keeps the
+        # metadata it was built with instead of claiming the current config
+        try:
+            return self.client.get_collection(name)
+        except Exception:
+            return self.client.create_collection(
+                name=name,
+                metadata={**metadata, **hnsw_metadata()}
+            )
+    
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        if self._embedding_model is None:
+            print(f" Loading embedding model: {EMBEDDING_MODEL}")
+            print(" First time will take 2-3 minutes to download...")
+            self._embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+            print(" Embedding model loaded!")
+        return self._embedding_model
     
     def generate_embedding(self, text: str) -> List[float]:
         prefixed_text = f"passage: {text}"
         embedding = self.embedding_model.encode(prefixed_text)
         return embedding.tolist()
     
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings = self.embedding_model.encode([f"passage: {text}" for text in texts])
+        return embeddings.tolist()
+    
+    def period_metadata(self, metadata: Dict) -> Dict:
+        # Filter fields for period queries; older processed files lack them
+        return {
+            'filing_date': metadata.get('filing_date', 0),
+            'fiscal_year': metadata.get('fiscal_year', 0),
+            'fiscal_period': metadata.get('fiscal_period', '')
+        }
+    
     def load_processed_chunks(self) -> List[Dict]:
         chunks_file = PROCESSED_DATA_DIR / "processed_chunks.json"
         
@@ -53,19 +223,44 @@ class VectorStoreManager:
         print(f" Loaded {len(chunks)} chunks")
         return chunks
     
-    def add_chunks_to_vectorstore(self, chunks: List[Dict], batch_size: int = 10):
+    def load_processed_facts(self) -> List[Dict]:
+        facts_file = PROCESSED_DATA_DIR / "processed_facts.json"
+        if not facts_file.exists():
+            print(f" No financial facts found at {facts_file}")
+            return []
+        with open(facts_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def load_processed_hierarchy(self) -> Tuple[List[Dict], List[Dict]]:
+        records = []
+        for name in ("processed_sections.json", "processed_filings.json"):
+            path = PROCESSED_DATA_DIR / name
+            if not path.exists():
+                print(f" No hierarchy records found at {path}")
+                records.append([])
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                records.append(json.load(f))
+        
+        sections, filings = records
+        print(f" Loaded {len(sections)} sections and {len(filings)} filings")
+        return sections, filings
+    
+    def add_chunks_to_vectorstore(self, chunks: List[Dict], batch_size: int = 10,
+                                  progress: Callable[[int, int], None] = None,
+                                  pause: Callable[[], None] = None):
         print(f"\n{'='*60}")
         print(" Creating Embeddings & Storing in Vector DB")
         print(f"{'='*60}\n")
         
         total_chunks = len(chunks)
+        self.section_sums = {}
         
         for i in tqdm(range(0, total_chunks, batch_size), desc="Processing batches"):
             batch = chunks[i:i + batch_size]
             
             ids = []
             texts = []
-            embeddings = []
             metadatas = []
             
             for idx, chunk in enumerate(batch):
@@ -74,18 +269,31 @@ class VectorStoreManager:
                 ids.append(chunk_id)
                 texts.append(chunk['text'])
                 
-                embedding = self.generate_embedding(chunk['text'])
-                embeddings.append(embedding)
-                
                 metadata = {
                     'ticker': chunk['metadata']['ticker'],
                     'filing_type': chunk['metadata']['filing_type'],
                     'accession_number': chunk['metadata']['accession_number'],
                     'chunk_id': str(chunk['metadata']['chunk_id']),
-                    'filename': chunk['metadata']['filename']
+                    'filename': chunk['metadata']['filename'],
+                    'section': chunk['metadata'].get('section', 'ALL'),
+                    'section_title': chunk['metadata'].get('section_title', 'Full Filing'),
+                    'section_id': chunk['metadata'].get(
+                        'section_id', f"{chunk['metadata']['accession_number']}:ALL"
+                    ),
+                    **self.period_metadata(chunk['metadata'])
                 }
                 metadatas.append(metadata)
             
+            embeddings = self.generate_embeddings(texts)
+            
+            # Running sums give each section the centroid of its chunks
+            for metadata, embedding in zip(metadatas, embeddings):
+                section_sum = self.section_sums.get(metadata['section_id'])
+                if section_sum is None:
+                    self.section_sums[metadata['section_id']] = np.array(embedding)
+                else:
+                    section_sum += embedding
+            
             self.collection.add(
                 ids=ids,
                 embeddings=embeddings,
@@ -93,7 +301,14 @@ class VectorStoreManager:
                 metadatas=metadatas
             )
             
-            time.sleep(0.1)
+            if progress:
+                progress(min(i + batch_size, total_chunks), total_chunks)
+            
+            # Background ingestion passes its own CPU budget
+            if pause:
+                pause()
+            else:
+                time.sleep(0.1)
         
         total_docs = self.collection.count()
         print(f"\n{'='*60}")
@@ -104,6 +319,66 @@ class VectorStoreManager:
         print(f" Database location: {VECTOR_DB_DIR}")
         print(f"{'='*60}\n")
     
+    def add_hierarchy_to_vectorstore(self, sections: List[Dict], filings: List[Dict],
+                                     batch_size: int = 50, pause: Callable[[], None] = None):
+        print(" Building hierarchical index (sections and filings)...")
+        
+        for i in tqdm(range(0, len(sections), batch_size), desc="Sections"):
+            batch = [
+                section for section in sections[i:i + batch_size]
+                if section['section_id'] in self.section_sums
+            ]
+            if not batch:
+                continue
+            
+            embeddings = []
+            for section in batch:
+                centroid = self.section_sums[section['section_id']]
+                embeddings.append((centroid / np.linalg.norm(centroid)).tolist())
+            
+            self.sections_collection.upsert(
+                ids=[section['section_id'] for section in batch],
+                embeddings=embeddings,
+                documents=[section['text'] for section in batch],
+                metadatas=[
+                    {
+                        'ticker': section['metadata']['ticker'],
+                        'filing_type': section['metadata']['filing_type'],
+                        'accession_number': section['metadata']['accession_number'],
+                        'section': section['metadata']['section'],
+                        'section_title': section['metadata']['section_title'],
+                        'section_id': section['section_id'],
+                        **self.period_metadata(section['metadata'])
+                    }
+                    for section in batch
+                ]
+            )
+            if pause:
+                pause()
+        
+        for i in tqdm(range(0, len(filings), batch_size), desc="Filings"):
+            batch = filings[i:i + batch_size]
+            
+            self.filings_collection.upsert(
+                ids=[filing['metadata']['accession_number'] for filing in batch],
+                embeddings=self.generate_embeddings([filing['text'] for filing in batch]),
+                documents=[filing['text'] for filing in batch],
+                metadatas=[
+                    {
+                        'ticker': filing['metadata']['ticker'],
+                        'filing_type': filing['metadata']['filing_type'],
+                        'accession_number': filing['metadata']['accession_number'],
+                        **self.period_metadata(filing['metadata'])
+                    }
+                    for filing in batch
+                ]
+            )
+            if pause:
+                pause()
+        
+        print(f" Sections indexed: {self.sections_collection.count()}")
+        print(f" Filings indexed: {self.filings_collection.count()}")
+    
     def test_query(self, query: str, n_results: int = 3):
         print(f"\n Testing query: '{query}'")
         
@@ -121,16 +396,190 @@ class VectorStoreManager:
             print(f"Filing: {metadata['filing_type']}")
             print(f"Text: {doc[:200]}...")
 
-def main():
-    manager = VectorStoreManager()
+    def list_filings(self, page_size: int = 5000) -> List[Dict]:
+        filings = {}
+        offset = 0
+        while True:
+            page = self.collection.get(limit=page_size, offset=offset, include=['metadatas'])
+            if not page['ids']:
+                break
+            for metadata in page['metadatas']:
+                filings.setdefault(metadata['accession_number'], {
+                    'accession_number': metadata['accession_number'],
+                    'ticker': metadata['ticker'],
+                    'filing_type': metadata['filing_type'],
+                    'filing_date': metadata.get('filing_date', 0)
+                })
+            offset += page_size
+        return list(filings.values())
     
-    chunks = manager.load_processed_chunks()
+    def superseded_filings(self, keep_10k: int, keep_10q: int) -> List[Dict]:
+        keep = {'10-K': keep_10k, '10-Q': keep_10q}
+        grouped = {}
+        for filing in self.list_filings():
+            grouped.setdefault((filing['ticker'], filing['filing_type']), []).append(filing)
+        
+        superseded = []
+        for (ticker, filing_type), filings in grouped.items():
+            if filing_type not in keep:
+                continue
+            filings.sort(key=accession_sort_key, reverse=True)
+            superseded.extend(filings[keep[filing_type]:])
+        return superseded
     
-    if not chunks:
-        print(" No chunks to process!")
-        return
+    def measure_query_latency(self, samples: int = 20, n_results: int = 5) -> float:
+        # Stored embeddings stand in for queries, so no model is needed
+        probe = self.collection.get(limit=samples, include=['embeddings'])
+        if not probe['ids']:
+            return 0.0
+        
+        timings = []
+        for embedding in probe['embeddings']:
+            start = time.perf_counter()
+            self.collection.query(query_embeddings=[embedding], n_results=n_results)
+            timings.append(time.perf_counter() - start)
+        return float(np.median(timings)) * 1000
+    
+    def index_report(self) -> Dict:
+        return {
+            'collection': self.collection_name,
+            'chunks': self.collection.count(),
+            'hnsw': collection_hnsw_params(self.collection),
+            'index_bytes': collection_disk_bytes(self.collection_name),
+            'median_query_ms': round(self.measure_query_latency(), 2)
+        }
     
-    manager.add_chunks_to_vectorstore(chunks)
+    def rebuild_collection(self, exclude_accessions: List[str] = None,
+                           page_size: int = 1000) -> str:
+        # The copy is built beside the live one, leaving out excluded filings, and
+        # swapped in. The live collection is never modified, so running API processes
+        # keep querying a consistent index and the previous one stays whole for rollback.
+        # The copy also picks up the current HNSW_PARAMS.
+        exclude = set(exclude_accessions or [])
+        with IndexLock():
+            return self._rebuild_into(
+                f"{COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}", exclude, page_size
+            )
+    
+    def _rebuild_into(self, new_name: str, exclude: set, page_size: int) -> str:
+        print(f" Rebuilding into collection '{new_name}' with HNSW settings {HNSW_PARAMS}...")
+        
+        for suffix in ("",) + HIERARCHY_SUFFIXES:
+            # Read only: a missing hierarchy level is skipped, never created in the live namespace
+            try:
+                source = self.client.get_collection(f"{self.collection_name}{suffix}")
+            except Exception:
+                print(f" No collection '{self.collection_name}{suffix}', skipping it")
+                continue
+            target = self.client.create_collection(
+                name=f"{new_name}{suffix}",
+                metadata={**(source.metadata or {}), **hnsw_metadata()}
+            )
+            offset = 0
+            while True:
+                page = source.get(
+                    limit=page_size,
+                    offset=offset,
+                    include=['embeddings', 'documents', 'metadatas']
+                )
+                if not page['ids']:
+                    break
+                keep = [
+                    i for i, metadata in enumerate(page['metadatas'])
+                    if metadata.get('accession_number') not in exclude
+                ]
+                if keep:
+                    target.add(
+                        ids=[page['ids'][i] for i in keep],
+                        embeddings=[page['embeddings'][i] for i in keep],
+                        documents=[page['documents'][i] for i in keep],
+                        metadatas=[page['metadatas'][i] for i in keep]
+                    )
+                offset += len(page['ids'])
+        
+        copy_facts(self.collection_name, new_name, list(exclude))
+        
+        pointer = set_active_collection(new_name)
+        self.drop_stale_collections(keep=[pointer['active'], pointer['previous']])
+        
+        self.open_collection(new_name)
+        return new_name
+    
+    def drop_stale_collections(self, keep: List[str]):
+        # The previous collection stays for rollback and for queries still running on it.
+        # Callers hold IndexLock, so no other process is building a collection right now.
+        keep_names = {f"{name}{suffix}" for name in keep if name for suffix in ("",) + HIERARCHY_SUFFIXES}
+        for collection in self.client.list_collections():
+            if collection.name.startswith(COLLECTION_NAME) and collection.name not in keep_names:
+                print(f" Dropping stale collection '{collection.name}'")
+                self.client.delete_collection(collection.name)
+        
+        keep_facts = {facts_db_path(name) for name in keep if name}
+        for path in FACTS_DB_PATH.parent.glob(f"financial_facts_{COLLECTION_NAME}*.db"):
+            if path not in keep_facts:
+                path.unlink()
+    
+    def apply_retention(self, keep_10k: int = RETENTION_KEEP_10K,
+                        keep_10q: int = RETENTION_KEEP_10Q,
+                        dry_run: bool = False) -> Dict:
+        print(f"\n{'='*60}")
+        print(" Index Retention & Compaction")
+        print(f"{'='*60}\n")
+        
+        before = self.index_report()
+        superseded = self.superseded_filings(keep_10k, keep_10q)
+        print(f" Keeping last {keep_10k} 10-Ks and {keep_10q} 10-Qs per ticker")
+        print(f" Superseded filings: {len(superseded)}")
+        for filing in superseded:
+            print(f"   {filing['ticker']} {filing['filing_type']} {filing['accession_number']}")
+        
+        if dry_run or not superseded:
+            return {'before': before, 'after': before, 'deleted': superseded}
+        
+        self.rebuild_collection(exclude_accessions=[filing['accession_number'] for filing in superseded])
+        
+        after = self.index_report()
+        
+        print(f"\n{'='*60}")
+        print(" RETENTION SUMMARY")
+        print(f"{'='*60}")
+        print(f" {'':<18}{'Before':>14}{'After':>14}")
+        print(f" {'Collection':<18}{before['collection']:>14}{after['collection']:>14}")
+        print(f" {'Chunks':<18}{before['chunks']:>14}{after['chunks']:>14}")
+        print(f" {'Index (MB)':<18}{before['index_bytes'] / 1e6:>14.1f}{after['index_bytes'] / 1e6:>14.1f}")
+        print(f" {'Median query (ms)':<18}{before['median_query_ms']:>14}{after['median_query_ms']:>14}")
+        print(f"{'='*60}\n")
+        
+        return {'before': before, 'after': after, 'deleted': superseded}
+
+def build_index():
+    # Built into a new collection and swapped in like an ingest job, so a running API
+    # drops answers and retrievals cached from the old index and pre-warms the new one
+    with IndexLock():
+        manager = VectorStoreManager(
+            collection_name=f"{COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}"
+        )
+        
+        chunks = manager.load_processed_chunks()
+        
+        if not chunks:
+            print(" No chunks to process!")
+            for suffix in ("",) + HIERARCHY_SUFFIXES:
+                manager.client.delete_collection(f"{manager.collection_name}{suffix}")
+            return
+        
+        manager.add_chunks_to_vectorstore(chunks)
+        
+        sections, filings = manager.load_processed_hierarchy()
+        manager.add_hierarchy_to_vectorstore(sections, filings)
+        
+        FinancialFactsIndex(facts_db_path(manager.collection_name)).add_facts(
+            manager.load_processed_facts()
+        )
+        
+        pointer = set_active_collection(manager.collection_name)
+        manager.drop_stale_collections(keep=[pointer['active'], pointer['previous']])
+        print(f" Active collection is now '{manager.collection_name}'")
     
     print("\n" + "="*60)
     print(" TESTING VECTOR STORE")
@@ -140,5 +589,41 @@ def main():
     
     print("\n Vector store setup complete!")
 
+def main():
+    parser = argparse.ArgumentParser(description="Build and maintain the SEC filings vector store")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    compact = subparsers.add_parser(
+        "compact",
+        help="Rebuild the index without superseded filings"
+    )
+    compact.add_argument("--keep-10k", type=int, default=RETENTION_KEEP_10K)
+    compact.add_argument("--keep-10q", type=int, default=RETENTION_KEEP_10Q)
+    compact.add_argument("--dry-run", action="store_true",
+                         help="List superseded filings without deleting anything")
+    
+    subparsers.add_parser(
+        "rebuild",
+        help="Rebuild the active index, e.g. to apply new HNSW settings"
+    )
+    
+    args = parser.parse_args()
+    
+    if args.command == "compact":
+        VectorStoreManager().apply_retention(
+            keep_10k=args.keep_10k,
+            keep_10q=args.keep_10q,
+            dry_run=args.dry_run
+        )
+    elif args.command == "rebuild":
+        manager = VectorStoreManager()
+        before = manager.index_report()
+        manager.rebuild_collection()
+        after = manager.index_report()
+        print(f" HNSW {before['hnsw']} -> {after['hnsw']}")
+        print(f" Median query {before['median_query_ms']} ms -> {after['median_query_ms']} ms")
+    else:
+        build_index()
+
 if __name__ == "__main__":
     main()
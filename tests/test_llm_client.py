@@ -0,0 +1,174 @@
+"""
+OllamaPool against local mock Ollama servers
+Run with: python -m pytest tests
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import json
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import ollama
+
+import llm_client
+from llm_client import OllamaPool
+
+MODEL = "llama3.1"
+
+class MockOllama:
+    # Serves /api/tags and /api/generate, or fails them with `status`
+
+    def __init__(self, delay: float = 0.0):
+        self.status = 200
+        self.delay = delay
+        self.models = [f"{MODEL}:latest"]
+        self.generate_calls = 0
+        self.tag_calls = 0
+        self.prompts = []
+        self._lock = threading.Lock()
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status: int, body: dict):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                with mock._lock:
+                    mock.tag_calls += 1
+                if mock.status != 200:
+                    return self.send_json(mock.status, {"error": "unavailable"})
+                self.send_json(200, {"models": [{"name": name, "model": name} for name in mock.models]})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with mock._lock:
+                    mock.generate_calls += 1
+                    mock.prompts.append(request.get("prompt"))
+                time.sleep(mock.delay)
+                if mock.status != 200:
+                    return self.send_json(mock.status, {"error": f"mock failure {mock.status}"})
+
+                if not request.get("stream"):
+                    return self.send_json(200, {"model": MODEL, "response": "ok", "done": True, "context": [1, 2]})
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for part in ({"response": "o", "done": False},
+                             {"response": "k", "done": True, "context": [1, 2]}):
+                    self.wfile.write((json.dumps({"model": MODEL, **part}) + "\n").encode())
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.host = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class OllamaPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.first = MockOllama()
+        self.second = MockOllama()
+        self.pool = OllamaPool(hosts=[self.first.host, self.second.host], model=MODEL)
+        self._interval = llm_client.OLLAMA_HEALTH_CHECK_INTERVAL
+        llm_client.OLLAMA_HEALTH_CHECK_INTERVAL = 0.3
+
+    def tearDown(self):
+        llm_client.OLLAMA_HEALTH_CHECK_INTERVAL = self._interval
+        self.first.close()
+        self.second.close()
+
+    def test_routes_to_least_outstanding_host(self):
+        self.pool.backends[0].outstanding = 2
+        self.assertEqual(self.pool.generate("hi")['host'], self.second.host)
+
+        # Concurrent requests spread over both hosts
+        self.pool.backends[0].outstanding = 0
+        self.first.delay = self.second.delay = 0.3
+        threads = [threading.Thread(target=self.pool.generate, args=("hi",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.first.generate_calls, 2)
+        self.assertEqual(self.second.generate_calls, 3)
+        self.assertEqual([b['outstanding'] for b in self.pool.status()], [0, 0])
+
+    def test_fails_over_on_server_error(self):
+        self.first.status = 500
+        self.assertEqual(self.pool.generate("hi")['host'], self.second.host)
+        self.assertFalse(self.pool.backends[0].healthy)
+
+        # The failed host is skipped until the health check interval has passed
+        self.pool.generate("hi")
+        self.assertEqual(self.first.generate_calls, 1)
+
+    def test_fails_over_on_missing_model(self):
+        self.first.status = 404
+        self.assertEqual(self.pool.generate("hi")['host'], self.second.host)
+        self.assertFalse(self.pool.backends[0].healthy)
+
+    def test_stream_fails_over_before_first_token(self):
+        self.first.status = 500
+        parts = list(self.pool.generate_stream("hi"))
+        self.assertEqual(''.join(part['response'] for part in parts), "ok")
+        self.assertTrue(all(part['host'] == self.second.host for part in parts))
+
+    def test_client_errors_are_not_host_failures(self):
+        self.first.status = 400
+        with self.assertRaises(ollama.ResponseError):
+            self.pool.generate("hi")
+        self.assertTrue(self.pool.backends[0].healthy)
+        self.assertEqual(self.second.generate_calls, 0)
+
+    def test_reprobes_failed_host_after_interval(self):
+        self.first.status = 500
+        self.pool.generate("hi")
+        self.first.status = 200
+
+        self.pool.generate("hi")
+        self.assertEqual(self.first.tag_calls, 0)
+        self.assertFalse(self.pool.backends[0].healthy)
+
+        time.sleep(0.35)
+        self.assertEqual(self.pool.generate("hi")['host'], self.first.host)
+        self.assertEqual(self.first.tag_calls, 1)
+        self.assertTrue(self.pool.backends[0].healthy)
+
+    def test_reprobe_requires_the_model(self):
+        self.first.status = 500
+        self.pool.generate("hi")
+        self.first.status = 200
+        self.first.models = ["mistral:latest"]
+
+        time.sleep(0.35)
+        self.assertEqual(self.pool.generate("hi")['host'], self.second.host)
+        self.assertFalse(self.pool.backends[0].healthy)
+
+    def test_drops_context_when_its_host_fails(self):
+        self.first.status = 500
+        self.pool.generate(
+            "follow-up", context=[7, 8], preferred_host=self.first.host,
+            fallback_prompt="history + follow-up"
+        )
+        self.assertEqual(self.second.prompts, ["history + follow-up"])
+
+if __name__ == "__main__":
+    unittest.main()